@@ -0,0 +1,18 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'utilities'))
+
+from framework.generators import DataGenerator  # noqa: E402
+
+
+def test_batches_from_one_generator_dont_repeat():
+    generator = DataGenerator(seed=42)
+    card_numbers = [card.card_number for card in generator.credit_cards(3)]
+    card_numbers += [card.card_number for card in generator.credit_cards(3)]
+    card_numbers += list(generator.credit_card_columns(3)['card_number'])
+    emails = [user.email for user in generator.users(3)]
+    emails += [user.email for user in generator.users(3)]
+    emails += generator.user_columns(3)['email']
+    assert len(set(card_numbers)) == len(card_numbers) == 9
+    assert len(set(emails)) == len(emails) == 9
@@ -0,0 +1,31 @@
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'utilities'))
+
+from framework.models import Address, ModelIndex, Subscription  # noqa: E402
+
+
+def test_address_matches_its_record():
+    address = Address()
+    record = {'address_one': '4 Test Drive', 'address_two': 'Testville', 'city': 'Testerton', 'post_code': '0101',
+              'country': 'NZ'}
+    assert address.find_matches([record]) == [record]
+    assert ModelIndex(Address, [record]).find(address) == [record]
+
+
+def test_lazy_field_matches_its_record():
+    record = {'id': 'sub-1', 'created_at': '2018-05-31T01:02:03Z'}
+    subscription = Subscription(record)
+    assert subscription.created_at == datetime(2018, 5, 31, 1, 2, 3)
+    assert subscription.find_matches([record], ['id', 'created_at']) == [record]
+    assert subscription.find_matches([{'id': 'sub-1'}], ['id', 'created_at']) == []
+
+
+def test_model_only_keeps_raw_lazy_values():
+    plan_changes = [{'id': 'change-1'}]
+    subscription = Subscription({'id': 'sub-1', 'plan_changes': plan_changes, 'unused': 'x' * 1000})
+    assert subscription._raw == {'plan_changes': plan_changes}
+    assert [change.id for change in subscription.plan_changes] == ['change-1']
+    assert not subscription._raw
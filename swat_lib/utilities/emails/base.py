@@ -1,13 +1,24 @@
 import functools
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+
+from emails.links import LinkIndex, LinkQuery
+
+try:
+    import lxml  # noqa: F401 (only imported to check whether BeautifulSoup can use it)
+    DEFAULT_PARSER = 'lxml'  # Several times faster than html.parser
+except ImportError:
+    DEFAULT_PARSER = 'html.parser'
 
 
 def try_soup(func, bs_func_name):
     def wrapper(*args):
+        query = func(*args)
+        if isinstance(query, LinkQuery):
+            return args[0].link_index.query(query)  # Answered without building the soup
         if args[0].soup:
             soup_func = getattr(args[0].soup, bs_func_name)
-            return soup_func(func(*args))
+            return soup_func(query)
         else:
             raise NoSoupException
     return wrapper
@@ -20,6 +31,21 @@ def find_all(func):
     return try_soup(func, 'find_all')
 
 
+def memoize(func, name):
+    """
+    Decorator that caches the result of a property getter on the instance (in its results dict, under the property's
+    name), so that the soup is only searched on the first access.
+    """
+    @functools.wraps(func)
+    def wrapper(self):
+        try:
+            return self.results[name]
+        except KeyError:
+            result = self.results[name] = func(self)
+            return result
+    return wrapper
+
+
 class MetaEmail(type):
     """
     MetaClass for wrapping calling BeautifulSoup function on property values. Extension for the future: some way of
@@ -31,8 +57,9 @@ class MetaEmail(type):
         for attribute_name, attribute in class_dict.items():
             new_attr = attribute
             if isinstance(attribute, property):
-                # Wrap all properties in BeautifulSoup's find_all()
-                new_attr = property(find_all(attribute.__get__), attribute.__set__,  attribute.__delattr__)
+                # Wrap all properties in BeautifulSoup's find_all(), which is only called once per instance
+                new_attr = property(memoize(find_all(attribute.__get__), attribute_name), attribute.__set__,
+                                    attribute.__delattr__)
             new_class_dict[attribute_name] = new_attr
 
         return type.__new__(mcs, class_name, bases, new_class_dict)
@@ -43,11 +70,36 @@ class BaseEmail(object):
     Utility class for parsing HTML emails. The value of any property defined on a class that extends this will be
     treated as an argument for BeautifulSoup's find_all(), the return value of which will replace that property's value.
     Generally convenient, but use at your own risk.
+
+    Subclasses whose properties only look at certain tags can list them in parse_only, so that the rest of the email
+    isn't built into the tree at all (e.g. parse_only = ('a',) for properties that only match links).
+
+    Properties can also return a LinkQuery (see emails.links), which is answered from an index of the email's anchors
+    rather than the soup. The soup and the index are each only built when first needed.
     """
     __metaclass__ = MetaEmail
 
-    def __init__(self, html):
-        self.soup = BeautifulSoup(html, 'html.parser')
+    parse_only = None  # Names of the only tags to parse (all tags, if None)
+
+    def __init__(self, html, parser=None):
+        """
+        :param html: HTML of the email
+        :param parser: Parser for BeautifulSoup to use (defaults to lxml, if it's installed, otherwise html.parser)
+        """
+        self.html = html
+        self.parser = parser or DEFAULT_PARSER
+        self.results = {}  # Property name -> result of its find_all() or LinkQuery
+
+    def __getattr__(self, name):
+        # Only called for attributes that haven't been set yet
+        if name == 'soup':
+            strainer = SoupStrainer(list(self.parse_only)) if self.parse_only else None
+            self.soup = BeautifulSoup(self.html, self.parser, parse_only=strainer)
+            return self.soup
+        if name == 'link_index':
+            self.link_index = LinkIndex(self.html)
+            return self.link_index
+        raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
 
 
 class NoSoupException(Exception):
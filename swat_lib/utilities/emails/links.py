@@ -0,0 +1,196 @@
+"""
+Fast path for emails whose properties only need links (e.g. the password reset emails): rather than building a
+BeautifulSoup tree, the raw HTML is scanned once with an event-based parser, and the anchors indexed by their
+(normalized) text and href.
+
+Properties of a BaseEmail can return a LinkQuery instead of a find_all() argument, in which case the query is answered
+from the email's LinkIndex, e.g.
+
+    @property
+    def reset_password_links(self):
+        return LinkQuery(text_contains='reset password')
+"""
+from collections import namedtuple
+
+try:
+    from html.parser import HTMLParser
+except ImportError:
+    from HTMLParser import HTMLParser
+
+
+def normalize(text):
+    """
+    :return: The text in lower case, with runs of whitespace collapsed to single spaces
+    """
+    return ' '.join(text.split()).lower()
+
+
+class Link(object):
+    """
+    An anchor found in an email. It supports the parts of BeautifulSoup's Tag interface that make sense for a link on
+    its own: name, attrs, get(), has_attr(), link['href'], text, string, strings and get_text().
+
+    It isn't part of a tree, though, so there's no find(), find_all(), parent, children, etc. Properties that need those
+    should return a find_all() argument (answered from the soup) rather than a LinkQuery.
+    """
+    __slots__ = ('text', 'strings', 'attrs')
+
+    name = 'a'
+
+    def __init__(self, text, attrs, strings=None):
+        """
+        :param text: All of the text inside the anchor
+        :param attrs: dict of the anchor's attributes
+        :param strings: The separate strings that make up the text (e.g. of nested tags), if there are several
+        """
+        self.text = text
+        self.strings = tuple(strings) if strings is not None else (text,)
+        self.attrs = attrs
+
+    @property
+    def href(self):
+        return self.attrs.get('href')
+
+    @property
+    def string(self):
+        """
+        :return: The text of the link, if it's a single string (otherwise None, as for a Tag with several children)
+        """
+        return self.strings[0] if len(self.strings) == 1 else None
+
+    def get_text(self, separator='', strip=False):
+        """
+        :return: The text of the link, with its strings joined by the separator (and stripped, dropping empty ones,
+        if strip), as in Tag.get_text()
+        """
+        strings = self.strings
+        if strip:
+            strings = [string.strip() for string in strings if string.strip()]
+        return separator.join(strings)
+
+    def get(self, attribute, default=None):
+        return self.attrs.get(attribute, default)
+
+    def has_attr(self, attribute):
+        return attribute in self.attrs
+
+    def __getitem__(self, attribute):
+        return self.attrs[attribute]
+
+    def __repr__(self):
+        return 'Link(%r, %r)' % (self.text, self.href)
+
+
+class LinkQuery(namedtuple('LinkQuery', ['text_contains', 'text', 'href'])):
+    """
+    Query for the links of an email. All given criteria must match (with no criteria, all links match).
+    :param text_contains: Phrase that the link text must contain (case and whitespace insensitive)
+    :param text: Exact text of the link (case and whitespace insensitive)
+    :param href: Exact href of the link
+    """
+    __slots__ = ()
+
+    def __new__(cls, text_contains=None, text=None, href=None):
+        return super(LinkQuery, cls).__new__(cls, text_contains, text, href)
+
+
+class LinkExtractor(HTMLParser):
+    """
+    Collects the anchors of an HTML document, with the text inside them, in a single pass.
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self)  # Old-style class in Python 2, so super() can't be used
+        self.links = []
+        self.attrs = None  # Attributes of the anchor currently being read (None when outside of one)
+        self.text_parts = []  # Strings of the anchor (text between tags) so far
+        self.in_string = False  # Whether the next data continues the last string (i.e. no tag in between)
+
+    def handle_starttag(self, tag, attrs):
+        self.in_string = False
+        if tag == 'a':
+            self.end_link()  # Anchors can't be nested, so an unclosed one ends here
+            self.attrs = dict((name, value or '') for name, value in attrs)
+
+    def handle_endtag(self, tag):
+        self.in_string = False
+        if tag == 'a':
+            self.end_link()
+
+    def handle_data(self, data):
+        if self.attrs is not None:
+            if self.in_string:
+                self.text_parts[-1] += data  # E.g. the text either side of an entity reference, in Python 2
+            else:
+                self.text_parts.append(data)
+                self.in_string = True
+
+    # Only called in Python 2 (Python 3 converts references before handle_data)
+    def handle_entityref(self, name):
+        self.handle_data(self.unescape('&%s;' % name))
+
+    def handle_charref(self, name):
+        self.handle_data(self.unescape('&#%s;' % name))
+
+    def end_link(self):
+        if self.attrs is not None:
+            self.links.append(Link(''.join(self.text_parts), self.attrs, self.text_parts))
+            self.attrs = None
+            self.text_parts = []
+
+    def close(self):
+        HTMLParser.close(self)
+        self.end_link()
+
+
+class LinkIndex(object):
+    """
+    The links of an email, indexed by normalized text and by href. Lookups by text or href are dict lookups; the
+    results of text_contains queries are cached by phrase, so each phrase is only matched against the links once.
+    """
+
+    def __init__(self, html):
+        extractor = LinkExtractor()
+        extractor.feed(html)
+        extractor.close()
+
+        self.links = extractor.links
+        self.by_text = {}
+        self.by_href = {}
+        for link in self.links:
+            self.by_text.setdefault(normalize(link.text), []).append(link)
+            self.by_href.setdefault(link.href, []).append(link)
+        self.by_phrase = {}  # Phrase -> links containing it, filled in as phrases are queried
+
+    def containing(self, phrase):
+        """
+        :return: Links whose text contains the phrase (case and whitespace insensitive)
+        """
+        phrase = normalize(phrase)
+        try:
+            return self.by_phrase[phrase]
+        except KeyError:
+            links = self.by_phrase[phrase] = [link for link in self.links if phrase in normalize(link.text)]
+            return links
+
+    def query(self, query):
+        """
+        :param query: LinkQuery
+        :return: List of the matching links, in document order
+        """
+        if query.text is not None:
+            links = self.by_text.get(normalize(query.text), [])
+        elif query.href is not None:
+            links = self.by_href.get(query.href, [])
+        elif query.text_contains is not None:
+            links = self.containing(query.text_contains)
+        else:
+            return list(self.links)
+
+        # Apply any remaining criteria to the (usually much shorter) list found from the index
+        return [
+            link for link in links
+            if (query.href is None or link.href == query.href) and
+               (query.text is None or normalize(link.text) == normalize(query.text)) and
+               (query.text_contains is None or normalize(query.text_contains) in normalize(link.text))
+        ]
@@ -1,19 +1,31 @@
 from emails.base import BaseEmail
+from emails.links import LinkQuery
 
 
 class ResetPasswordEmail(BaseEmail):
+    """
+    The properties are lists of emails.links.Link objects (not BeautifulSoup Tags), which have the attributes and text
+    of each link, but no find() etc.
+    """
+
+    parse_only = ('a',)
 
     @property
     def links(self):
-        return lambda tag: tag.name == 'a'
+        return LinkQuery()
 
     @property
     def reset_password_links(self):
-        return lambda tag: tag.name == 'a' and 'reset password' in tag.text.lower()
+        return LinkQuery(text_contains='reset password')
 
 
 class PasswordUpdatedEmail(BaseEmail):
+    """
+    The properties are lists of emails.links.Link objects, as in ResetPasswordEmail.
+    """
+
+    parse_only = ('a',)
 
     @property
     def get_support_links(self):
-        return lambda tag: tag.name == 'a' and 'get support' in tag.text.lower()
+        return LinkQuery(text_contains='get support')
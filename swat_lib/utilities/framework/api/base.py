@@ -1,22 +1,71 @@
 import functools
+import time
+import urlparse
+from timeit import default_timer
 from types import FunctionType
 
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from http.cookiejar import DefaultCookiePolicy
+except ImportError:
+    from cookielib import DefaultCookiePolicy
+
+from framework.api.cache import CachingSession
+from framework.api.circuit_breaker import circuit_breakers
+from framework.api.json_backend import decode_once
+from framework.api.metrics import api_metrics
+from framework.api.rate_limit import rate_limits
+from framework.api.retry import default_retry_policy
+
+
+DEFAULT_POOL_SIZE = 10
+
+
+def create_session(pool_size=DEFAULT_POOL_SIZE):
+    """
+    Creates the requests Session used by an API wrapper. Sessions keep connections alive between requests, so
+    consecutive calls to the same service don't each pay for a new TCP/TLS handshake.
+    :param pool_size: Maximum number of connections to keep open to each host (i.e. the number of concurrent requests
+    that can reuse connections)
+    :return: CachingSession, which serves the wrapper's cacheable methods from its response cache (if it has one), and
+    otherwise behaves as a plain requests Session. Response bodies are only decoded once (see
+    framework.api.json_backend).
+
+    Sessions are shared by every test (and user) that uses the wrapper, so unlike a plain Session, they don't keep
+    cookies set by responses: each call is as stateless as a bare requests.get. Cookies can still be passed to
+    individual calls, and are kept across redirects within a call.
+    """
+    session = CachingSession()
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))  # Reject every cookie from responses
+    session.hooks['response'].append(decode_once)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
 
 def log_request_and_response(func):
     """
     Decorator that logs the responses (and the requests they are responses to) returned by any given 'func'. Useful if
     you want to log all the responses returned to / requests made by an API wrapper.
+
+    Also records the timings and sizes of each call in framework.api.metrics.api_metrics.
     """
 
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
         response = None
+        start = default_timer()
         try:
             response = func(*args, **kwargs)
         except ResponseException as e:
             response = e.response  # Got a non-20x response
             raise  # May need to change this to preserve the original traceback in Python 3
         finally:
+            api_metrics.record_call(type(args[0]).__name__, func.__name__, response, default_timer() - start)
+
             # We still want to log the request/response if we receive an IdResponseException (i.e. and error response)
             if response is not None:  # Note: failure responses are falsey!
                 # Attempt to find a logger, and log the request and response
@@ -29,10 +78,128 @@ def log_request_and_response(func):
     return wrapper
 
 
+def retry_on_failure(func):
+    """
+    Decorator that retries calls to an API wrapper method that fail with a transient error (an error response with a
+    retryable status code, or a connection error), according to the wrapper's retry_policy (see framework.api.retry).
+    The number of retries and the time spent waiting between attempts are recorded in the API metrics.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        api = args[0]
+        policy = getattr(api, 'retry_policy', None) or default_retry_policy
+        opted_in = getattr(func, 'retry_non_idempotent', False)
+        endpoint = '%s.%s' % (type(api).__name__, func.__name__)
+
+        # Every call earns a little more retry budget
+        policy.budget.deposit()
+        attempt = 0
+
+        while True:
+            attempt += 1
+            try:
+                return func(*args, **kwargs)
+            except ResponseException as e:
+                delay = policy.get_retry_delay(attempt, e.response.request.method, e.response, opted_in)
+                if delay is None:
+                    raise
+            except (requests.ConnectionError, requests.Timeout) as e:
+                method = e.request.method if e.request is not None else None
+                delay = policy.get_retry_delay(attempt, method, None, opted_in)
+                if delay is None:
+                    raise
+
+            api_metrics.increment('retries', endpoint)
+            api_metrics.increment('retry_seconds', endpoint, delay)
+            time.sleep(delay)
+
+    return wrapper
+
+
+# Errors raised while reading a response that was received (e.g. invalid JSON, or a missing key), which show that the
+# host is up
+RESPONSE_CONTENT_ERRORS = (ValueError, LookupError)
+
+
+def with_circuit_breaker(func):
+    """
+    Decorator that guards calls to an API wrapper method with the circuit breaker for the wrapper's host (see
+    framework.api.circuit_breaker), failing fast with a CircuitOpenException if the host is known to be down.
+
+    Calls count as successes if they return, get a response with a non-5xx error status, or fail to read the content of
+    a response (see RESPONSE_CONTENT_ERRORS). 5xx responses, connection errors and timeouts count as failures, and any
+    other exception isn't counted either way.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        api = args[0]
+        breaker = circuit_breakers.get(urlparse.urlparse(api.base_url).netloc, getattr(api, 'logger', None))
+        breaker.before_call()
+
+        try:
+            response = func(*args, **kwargs)
+        except ResponseException as e:
+            if e.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()  # The host is up, even if it didn't like the request
+            raise
+        except (requests.ConnectionError, requests.Timeout):
+            breaker.record_failure()
+            raise
+        except RESPONSE_CONTENT_ERRORS:
+            breaker.record_success()  # E.g. a response with unexpected content: the host still responded
+            raise
+        except BaseException:
+            # E.g. a CircuitOpenException from a nested call, or a bug in the wrapper: neither a success nor a failure
+            breaker.record_cancelled()
+            raise
+
+        breaker.record_success()
+        return response
+
+    return wrapper
+
+
+def with_rate_limit(func):
+    """
+    Decorator that holds back calls to an API wrapper method according to the rate limit and concurrency limit of its
+    endpoint group, if it belongs to one (see framework.api.rate_limit). Time spent waiting is recorded in the API
+    metrics.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        endpoint = '%s.%s' % (type(args[0]).__name__, func.__name__)
+        group = rate_limits.get(endpoint)
+        if group is None:
+            return func(*args, **kwargs)
+
+        waited = group.acquire()
+        if waited:
+            api_metrics.increment('throttle_seconds', endpoint, waited)
+
+        status_code = None
+        try:
+            response = func(*args, **kwargs)
+            status_code = response.status_code
+            return response
+        except ResponseException as e:
+            status_code = e.status_code
+            raise
+        finally:
+            group.release(status_code)
+
+    return wrapper
+
+
 class MetaApi(type):
     """
     Metaclass for API wrapper classes that allows all requests/responses to be pretty-printed and logged (at 'info'
-    logging level and above).
+    logging level and above), recorded in the session's API metrics, retried on transient failures, guarded by a
+    per-host circuit breaker, and rate limited (if configured).
     """
 
     def __new__(mcs, class_name, bases, class_dict):
@@ -40,10 +207,11 @@ class MetaApi(type):
         ancestor = MetaApi.get_furthest_ancestor(bases[0])
 
         for attribute_name, attribute in class_dict.items():
-            # Log the pretty-printed request and response, if this method represents an API call
+            # Log the pretty-printed request and response (of every attempt), if this method represents an API call
             if not attribute_name.startswith('__') and isinstance(attribute, FunctionType):
                 if hasattr(ancestor, attribute_name):  # I.e. this method overrides a method in the furthest ancestor
                     attribute = log_request_and_response(attribute)
+                    attribute = retry_on_failure(with_circuit_breaker(with_rate_limit(attribute)))
             new_class_dict[attribute_name] = attribute
         return type.__new__(mcs, class_name, bases, new_class_dict)
 
@@ -0,0 +1,220 @@
+"""
+Bulk licence authorization, for load scenarios that simulate many host machines activating (or deactivating) licences
+at once.
+
+Records are read from any iterable (so they can be generated on the fly), and run through a bounded pool of worker
+threads that share a pool of keep-alive connections to the license service. At most a couple of records per worker are
+in flight at any time, so arbitrarily long streams can be processed in constant memory.
+
+E.g.
+
+    driver = BulkAuthorizationDriver(license_api, access_token_provider(id_api), max_workers=16, app_name='serato_dj')
+    records = (AuthorizationRecord(user, license_id, 'HOST-%d' % i, 'activate') for i in range(1000))
+    report = driver.run(records, result_path='authorizations.tsv')
+    log.info('\\n'.join(report.summary_lines()))
+"""
+import copy
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from timeit import default_timer
+
+from framework.api.base import ResponseException, create_session
+from framework.api.metrics import Histogram
+
+
+AuthorizationRecord = namedtuple('AuthorizationRecord', ['user', 'license_id', 'host_machine_id', 'action'])
+
+
+class AuthorizationResult(object):
+    """
+    Outcome of authorizing a single record.
+    """
+    __slots__ = ('record', 'status', 'seconds', 'authorization_id')
+
+    def __init__(self, record, status, seconds, authorization_id=None):
+        """
+        :param record: AuthorizationRecord that was processed
+        :param status: Status code of the (last) response, or 'error' if no response was received
+        :param seconds: Time taken to process the record (including the confirmation, if any)
+        :param authorization_id: ID of the authorization created, if successful
+        """
+        self.record = record
+        self.status = status
+        self.seconds = seconds
+        self.authorization_id = authorization_id
+
+    @property
+    def succeeded(self):
+        return self.status == 200
+
+    def to_line(self):
+        return '\t'.join(str(value) for value in (
+            self.record.action,
+            self.record.license_id,
+            self.record.host_machine_id,
+            getattr(self.record.user, 'id', ''),
+            self.status,
+            '%.1f' % (self.seconds * 1000),
+            self.authorization_id or ''
+        ))
+
+
+class BulkAuthorizationReport(object):
+    """
+    Per-action throughput and latency of a bulk authorization run.
+    """
+    COLUMNS = ('action', 'license_id', 'host_machine_id', 'user_id', 'status', 'latency_ms', 'authorization_id')
+
+    def __init__(self):
+        self.latencies = {}  # Action -> Histogram of latencies (in microseconds)
+        self.failures = {}  # Action -> number of failed records
+        self.elapsed = 0.0  # Wall clock time of the whole run
+
+    def add(self, result):
+        action = result.record.action
+        self.latencies.setdefault(action, Histogram()).record(result.seconds * 1e6)
+        if not result.succeeded:
+            self.failures[action] = self.failures.get(action, 0) + 1
+
+    def throughput(self, action):
+        """
+        :return: Records processed per second for the given action
+        """
+        histogram = self.latencies.get(action)
+        return histogram.count / self.elapsed if histogram and self.elapsed else 0.0
+
+    def summary_lines(self):
+        row_format = '%-20s %8s %8s %10s %9s %9s %9s %9s'
+        lines = [row_format % ('Action', 'Records', 'Failed', 'Per sec', 'p50 ms', 'p90 ms', 'p99 ms', 'Max ms')]
+
+        for action, histogram in sorted(self.latencies.items()):
+            lines.append(row_format % (
+                action,
+                histogram.count,
+                self.failures.get(action, 0),
+                '%.1f' % self.throughput(action),
+                '%.1f' % (histogram.percentile(50) / 1e3),
+                '%.1f' % (histogram.percentile(90) / 1e3),
+                '%.1f' % (histogram.percentile(99) / 1e3),
+                '%.1f' % (histogram.max / 1e3)
+            ))
+
+        return lines
+
+
+class BulkAuthorizationDriver(object):
+
+    def __init__(self, license_api, get_access_token, max_workers=8, app_name=None, app_version=None,
+                 host_machine_name=None, confirm_status_code=None):
+        """
+        :param license_api: LicenseApi to make requests with. A copy with a connection pool sized for `max_workers` is
+        used, so the original isn't affected.
+        :param get_access_token: Callable that returns an access token for a given user (see access_token_provider)
+        :param max_workers: Number of authorizations to run concurrently
+        :param app_name: App name to authorize for (e.g. 'serato_dj')
+        :param app_version: App version to authorize for
+        :param host_machine_name: Host machine name to send with each authorization (defaults to the host machine ID)
+        :param confirm_status_code: If given, each successful authorization is confirmed with this status code (via
+        PUT /me/licenses/authorizations/{authorization_id}), as the client app would
+        """
+        self.license_api = copy.copy(license_api)
+        self.license_api.session = create_session(pool_size=max_workers)
+        self.get_access_token = get_access_token
+        self.max_workers = max_workers
+        self.app_name = app_name
+        self.app_version = app_version
+        self.host_machine_name = host_machine_name
+        self.confirm_status_code = confirm_status_code
+
+    def run(self, records, result_path=None):
+        """
+        :param records: Iterable of AuthorizationRecords
+        :param result_path: Optional path of a file to write a line per record to (tab-separated; see
+        BulkAuthorizationReport.COLUMNS)
+        :return: BulkAuthorizationReport
+        """
+        report = BulkAuthorizationReport()
+        result_file = open(result_path, 'w') if result_path else None
+        start = default_timer()
+
+        def collect(futures):
+            for future in futures:
+                result = future.result()
+                report.add(result)
+                if result_file:
+                    result_file.write(result.to_line() + '\n')
+
+        try:
+            if result_file:
+                result_file.write('\t'.join(BulkAuthorizationReport.COLUMNS) + '\n')
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                pending = set()
+                for record in records:
+                    # Don't read further ahead in the stream than the workers can keep up with
+                    if len(pending) >= self.max_workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    pending.add(executor.submit(self.authorize, record))
+
+                collect(wait(pending)[0])
+        finally:
+            report.elapsed = default_timer() - start
+            if result_file:
+                result_file.close()
+
+        return report
+
+    def authorize(self, record):
+        """
+        Authorizes a single record. Errors are recorded in the result rather than raised, so that one failure doesn't
+        stop the run.
+        :param record: AuthorizationRecord
+        :return: AuthorizationResult
+        """
+        start = default_timer()
+        authorization_id = None
+
+        try:
+            access_token = self.get_access_token(record.user)
+            response = self.license_api.me_licenses_authorizations(
+                access_token=access_token,
+                action=record.action,
+                app_name=self.app_name,
+                app_version=self.app_version,
+                host_machine_id=record.host_machine_id,
+                host_machine_name=self.host_machine_name or record.host_machine_id,
+                license_id=record.license_id
+            )
+            authorization_id = response.json().get('id')
+
+            if self.confirm_status_code is not None:
+                response = self.license_api.put_me_licenses_authorizations(
+                    access_token=access_token,
+                    authorization_id=authorization_id,
+                    status_code=self.confirm_status_code
+                )
+
+            status = response.status_code
+        except ResponseException as e:
+            status = e.status_code
+        except Exception:
+            status = 'error'  # E.g. a connection error, or an open circuit breaker
+
+        return AuthorizationResult(record, status, default_timer() - start, authorization_id)
+
+
+def access_token_provider(id_api):
+    """
+    :param id_api: IdApi to log users in with
+    :return: Thread-safe callable that returns an access token for a given User, reusing the token from the user's
+    first login. (Two workers may occasionally both log the same user in, but logins aren't serialised behind a lock.)
+    """
+    tokens = {}
+
+    def get_access_token(user):
+        if user.email not in tokens:
+            tokens.setdefault(user.email, id_api.get_access_token_for_user(user.email, user.password))
+        return tokens[user.email]
+
+    return get_access_token
@@ -0,0 +1,191 @@
+"""
+Opt-in response cache for read-only reference endpoints (e.g. LicenseApi.get_product_types), which return data that
+rarely changes but are called again and again by tests.
+
+Only GET requests made by API wrapper methods marked with the `cacheable` decorator are cached, and only if the wrapper
+has been given a ResponseCache (e.g. `LicenseApi(..., response_cache=response_cache)`). Entries are keyed on the
+normalized URL (including the query parameters, in any order) and the authorization scope of the request, so responses
+are never shared between users.
+
+A fresh entry (younger than its TTL) is returned without making a request. Once an entry has gone stale, it is
+revalidated with If-None-Match (if the response had an ETag): a 304 response refreshes the entry without downloading
+the body again. Responses served from the cache have `from_cache` set to True.
+
+Entries are kept in memory (evicting the least recently used), and optionally on disk, so that they're shared between
+runs. Hits, misses and revalidations are counted in framework.api.metrics.api_metrics.
+"""
+import functools
+import hashlib
+import threading
+import time
+import urlparse
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import timedelta
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from framework.api.json_backend import decode_once
+from framework.api.metrics import api_metrics
+from framework.cache import TieredCache
+
+
+_local = threading.local()  # Holds the cache policy in effect on this thread (see cache_policy), if any
+
+
+class CachedResponse(namedtuple('CachedResponse', ['status_code', 'headers', 'content', 'encoding', 'url', 'etag',
+                                                   'stored_at'])):
+    __slots__ = ()
+
+    @classmethod
+    def from_response(cls, response):
+        return cls(
+            response.status_code,
+            dict(response.headers),
+            response.content,
+            response.encoding,
+            response.url,
+            response.headers.get('ETag'),
+            time.time()
+        )
+
+    def to_response(self, request):
+        """
+        :param request: PreparedRequest that the response is for (for logging)
+        :return: requests Response with the cached status, headers and body
+        """
+        response = requests.Response()
+        response.status_code = self.status_code
+        response.headers = CaseInsensitiveDict(self.headers)
+        response._content = self.content
+        response._content_consumed = True  # As requests does once a body has been read (see log.format_response)
+        response.encoding = self.encoding
+        response.url = self.url
+        response.request = request
+        response.elapsed = timedelta(0)
+        response.from_cache = True
+        return decode_once(response)
+
+
+class ResponseCache(TieredCache):
+
+    def __init__(self, ttl=300, max_entries=256, directory=None):
+        """
+        :param ttl: Number of seconds that responses are used without revalidating them (unless the endpoint specifies
+        its own TTL)
+        :param max_entries: Maximum number of responses to keep in memory
+        :param directory: Optional directory to also keep responses in, so that they're shared between runs
+        """
+        super(ResponseCache, self).__init__(max_entries, directory)
+        self.ttl = ttl
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        :param config: dict of ResponseCache arguments (e.g. the 'response_cache' configuration), or None
+        :return: ResponseCache, or None if there's no configuration (i.e. caching is disabled)
+        """
+        return cls(**dict(config)) if config else None
+
+
+def cache_key(request):
+    """
+    :param request: PreparedRequest
+    :return: Key for the request's response: its method, normalized URL and a hash of its authorization header (so that
+    credentials aren't kept in the cache)
+    """
+    url = urlparse.urlsplit(request.url)
+    query = sorted(urlparse.parse_qsl(url.query, keep_blank_values=True))
+    authorization = request.headers.get('Authorization') or ''
+    if not isinstance(authorization, bytes):
+        authorization = authorization.encode('utf-8')
+
+    return '%s %s://%s%s?%r %s' % (
+        request.method,
+        url.scheme.lower(),
+        url.netloc.lower(),
+        url.path or '/',
+        query,
+        hashlib.sha256(authorization).hexdigest()
+    )
+
+
+@contextmanager
+def cache_policy(cache, ttl, endpoint):
+    """
+    Context manager that serves GET requests made (on this thread) by CachingSessions from the given cache, e.g. to
+    revalidate a listing with If-None-Match while polling it (ttl=0).
+    :param cache: ResponseCache
+    :param ttl: Number of seconds to use responses for without revalidating them
+    :param endpoint: Endpoint name to count hits and misses against in the API metrics
+    """
+    previous = getattr(_local, 'policy', None)
+    _local.policy = (cache, ttl, endpoint)
+    try:
+        yield
+    finally:
+        _local.policy = previous
+
+
+def cacheable(ttl=None):
+    """
+    Decorator that marks an API wrapper method as safe to cache: GET requests made by the method are served from the
+    wrapper's response_cache, if it has one.
+    :param ttl: Number of seconds to use responses for without revalidating them (defaults to the cache's TTL)
+    """
+
+    def decorator(func):
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            api = args[0]
+            cache = getattr(api, 'response_cache', None)
+            if cache is None:
+                return func(*args, **kwargs)
+
+            with cache_policy(cache, cache.ttl if ttl is None else ttl, '%s.%s' % (type(api).__name__, func.__name__)):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class CachingSession(requests.Session):
+    """
+    Session that serves GET requests from a ResponseCache while a cacheable method is being called (see module
+    docstring). Otherwise, it behaves exactly like a requests Session.
+    """
+
+    def request(self, method, url, params=None, data=None, headers=None, **kwargs):
+        policy = getattr(_local, 'policy', None)
+        if policy is None or method.upper() != 'GET' or kwargs.get('stream'):
+            return super(CachingSession, self).request(method, url, params=params, data=data, headers=headers, **kwargs)
+
+        cache, ttl, endpoint = policy
+        request = self.prepare_request(
+            requests.Request('GET', url, params=params, headers=headers, auth=kwargs.get('auth'))
+        )
+        key = cache_key(request)
+        entry = cache.get(key)
+
+        if entry is not None and time.time() - entry.stored_at < ttl:
+            api_metrics.increment('cache_hits', endpoint)
+            return entry.to_response(request)
+
+        if entry is not None and entry.etag:
+            headers = dict(headers or {}, **{'If-None-Match': entry.etag})
+
+        response = super(CachingSession, self).request(method, url, params=params, data=data, headers=headers, **kwargs)
+
+        if entry is not None and response.status_code == 304:
+            entry = entry._replace(stored_at=time.time())
+            cache.set(key, entry)
+            api_metrics.increment('cache_revalidations', endpoint)
+            return entry.to_response(response.request)
+
+        api_metrics.increment('cache_misses', endpoint)
+        if response.status_code == 200:
+            cache.set(key, CachedResponse.from_response(response))
+        return response
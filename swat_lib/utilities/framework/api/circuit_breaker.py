@@ -0,0 +1,204 @@
+"""
+Per-host circuit breakers for the API wrappers (used by framework.api.base.with_circuit_breaker, which MetaApi applies
+to every API wrapper method).
+
+When a service (e.g. id_home or ecom_home) is down, there's no point in every test waiting for its own timeouts and
+retries. Each host gets a breaker that watches the outcome of recent calls:
+
+- closed: calls go through as normal. If too many of the recent calls failed, the breaker opens.
+- open: calls fail immediately with a CircuitOpenException, until `reset_timeout` seconds have passed.
+- half-open: a single trial call is let through. If it succeeds the breaker closes, otherwise it opens again.
+
+Only server-side failures (5xx responses, connection errors and timeouts) count as failures: a 4xx response still
+means that the service is up.
+"""
+import threading
+import time
+from collections import deque
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker(object):
+
+    def __init__(self, host, error_rate_threshold=0.5, window_size=20, min_calls=5, reset_timeout=30.0,
+                 on_transition=None):
+        """
+        :param host: Host (e.g. 'id.serato.xyz') that this breaker protects
+        :param error_rate_threshold: Proportion of failed calls (within the window) at which the breaker opens
+        :param window_size: Number of recent calls to calculate the error rate from
+        :param min_calls: Minimum number of calls in the window before the breaker can open
+        :param reset_timeout: Seconds to wait before letting a trial call through an open breaker
+        :param on_transition: Optional callable(breaker, old_state, new_state) called whenever the state changes
+        """
+        self.host = host
+        self.error_rate_threshold = error_rate_threshold
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.on_transition = on_transition
+
+        self.state = CLOSED
+        self.outcomes = deque(maxlen=window_size)  # True for each failed call
+        self.opened_at = None
+        self.trial_in_progress = False
+        self.lock = threading.Lock()
+
+    @property
+    def error_rate(self):
+        return float(sum(self.outcomes)) / len(self.outcomes) if self.outcomes else 0.0
+
+    def before_call(self):
+        """
+        Checks whether a call may be made, raising a CircuitOpenException if not.
+        """
+        with self.lock:
+            transitions = []
+
+            if self.state == OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                transitions.append(self.transition(HALF_OPEN))
+
+            allowed = self.state == CLOSED or (self.state == HALF_OPEN and not self.trial_in_progress)
+            if self.state == HALF_OPEN and allowed:
+                self.trial_in_progress = True
+
+        self.report(transitions)
+
+        if not allowed:
+            raise CircuitOpenException(self.host, self.opened_at + self.reset_timeout, self.error_rate)
+
+    def record_success(self):
+        with self.lock:
+            transitions = []
+            if self.state == HALF_OPEN:
+                self.outcomes.clear()
+                transitions.append(self.transition(CLOSED))
+            self.outcomes.append(False)
+
+        self.report(transitions)
+
+    def record_cancelled(self):
+        """
+        Ends a call whose outcome says nothing about the health of the host (e.g. one that failed before a response was
+        received, for reasons of its own), without recording it. If it was the trial call of a half-open breaker,
+        another trial call is let through.
+        """
+        with self.lock:
+            if self.state == HALF_OPEN:
+                self.trial_in_progress = False
+
+    def record_failure(self):
+        with self.lock:
+            transitions = []
+            self.outcomes.append(True)
+
+            if self.state == HALF_OPEN:
+                transitions.append(self.transition(OPEN))
+            elif self.state == CLOSED and len(self.outcomes) >= self.min_calls:
+                if self.error_rate >= self.error_rate_threshold:
+                    transitions.append(self.transition(OPEN))
+
+        self.report(transitions)
+
+    def transition(self, new_state):
+        """
+        Changes the state of the breaker. Must be called while holding the lock.
+        :return: (old_state, new_state) tuple, to be reported (see report) once the lock has been released
+        """
+        old_state, self.state = self.state, new_state
+        self.trial_in_progress = False
+        if new_state == OPEN:
+            self.opened_at = time.time()
+        return old_state, new_state
+
+    def report(self, transitions):
+        """
+        Notifies on_transition of state changes. Called outside the lock, as reporting may be slow (e.g. posting to
+        Slack) and shouldn't hold up other callers.
+        """
+        if self.on_transition:
+            for old_state, new_state in transitions:
+                self.on_transition(self, old_state, new_state)
+
+
+class CircuitBreakers(object):
+    """
+    Registry of circuit breakers (one per host), shared by all of the API wrappers in a session.
+
+    State changes are reported to `logger` (a framework.log.Log) once per change, rather than once per test: the breaker
+    opening is logged as an error (and sent to `slack_recipients`), and recovery is logged as info. Repeated failures of
+    trial calls while a service is still down are only logged at debug level.
+    """
+
+    def __init__(self, **breaker_kwargs):
+        """
+        :param breaker_kwargs: Arguments for each CircuitBreaker (e.g. error_rate_threshold, reset_timeout)
+        """
+        self.breaker_kwargs = breaker_kwargs
+        self.breakers = {}
+        self.logger = None
+        self.slack_recipients = None
+        self.lock = threading.Lock()
+
+    def configure(self, **breaker_kwargs):
+        """
+        Change the arguments used for breakers, resetting any existing breakers.
+        """
+        with self.lock:
+            self.breaker_kwargs = breaker_kwargs
+            self.breakers = {}
+
+    def get(self, host, logger=None):
+        """
+        :param host: Host that the breaker protects
+        :param logger: Logger to report state changes to, if this registry doesn't have one of its own
+        :return: The CircuitBreaker for the given host
+        """
+        with self.lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                on_transition = lambda *args: self.report_transition(logger, *args)
+                breaker = CircuitBreaker(host, on_transition=on_transition, **self.breaker_kwargs)
+                self.breakers[host] = breaker
+            return breaker
+
+    def report_transition(self, fallback_logger, breaker, old_state, new_state):
+        logger = self.logger or fallback_logger
+        if not logger:
+            return
+
+        if new_state == OPEN and old_state == CLOSED:
+            logger.error(
+                'Circuit breaker for %s opened: %d%% of the last %d API calls failed. Calls to this host will fail '
+                'immediately for the next %d seconds.'
+                % (breaker.host, breaker.error_rate * 100, len(breaker.outcomes), breaker.reset_timeout),
+                slack_recipients=self.slack_recipients
+            )
+        elif new_state == CLOSED:
+            logger.info('Circuit breaker for %s closed: the host is responding again.' % breaker.host)
+        else:
+            logger.debug('Circuit breaker for %s changed state from %s to %s.' % (breaker.host, old_state, new_state))
+
+
+class CircuitOpenException(Exception):
+    """
+    Thrown (instead of making a request) when the circuit breaker for the requested host is open.
+    """
+    def __init__(self, host, retry_at, error_rate):
+        """
+        :param host: Host whose breaker is open
+        :param retry_at: Time (epoch seconds) at which a trial call will be let through
+        :param error_rate: Proportion of recent calls to the host that failed
+        """
+        super(CircuitOpenException, self).__init__(
+            'Circuit breaker for %s is open (%d%% of recent calls failed); not calling it for another %.0f seconds'
+            % (host, error_rate * 100, max(retry_at - time.time(), 0))
+        )
+        self.host = host
+        self.retry_at = retry_at
+
+
+# Shared by all API wrappers, so that every test sees the same state for each host
+circuit_breakers = CircuitBreakers()
@@ -1,8 +1,12 @@
+import functools
 import urlparse
+from timeit import default_timer
 
-import requests
-
-from framework.api.base import ResponseException, MetaApi
+from framework.api.base import ResponseException, MetaApi, create_session
+from framework.api.cache import ResponseCache, cache_policy
+from framework.api.fan_out import fan_out
+from framework.api.polling import wait_until, WaitTimeout
+from framework.models import Order, PaymentMethod, Subscription
 
 
 class BaseEcomApi(object):
@@ -13,6 +17,7 @@ class BaseEcomApi(object):
     __metaclass__ = MetaApi
 
     logger = None
+    retry_policy = None  # framework.api.retry.RetryPolicy (the default policy is used if None)
 
     # ALL /me/ endpoints here
 
@@ -324,15 +329,17 @@ class EcomAPI(BaseEcomApi):
     """
     Wrapper for the Ecom service API.
     """
-    def __init__(self, base_url, urls, logger=None):
+    def __init__(self, base_url, urls, logger=None, session=None):
         """
         :param base_url: Base URL of the ID service (for a specific stack)
         :param urls: URLS for the ID service's endpoints (from the configuration object)
         :param logger: Optional logger instance (Log from framework.log). For logging requests/responses
+        :param session: Optional requests Session to make requests with (e.g. to share a connection pool)
         """
         self.base_url = base_url
         self.urls = urls
         self.logger = logger
+        self.session = session or create_session()
 
     def get_me_payment_methods(self, access_token):
         """
@@ -351,7 +358,7 @@ class EcomAPI(BaseEcomApi):
         if access_token:
             headers['Authorization'] = 'Bearer %s' % access_token
 
-        response = requests.get(
+        response = self.session.get(
             url,
             params=params,
             data=body,
@@ -385,7 +392,7 @@ class EcomAPI(BaseEcomApi):
         if access_token:
             headers['Authorization'] = 'Bearer %s' % access_token
 
-        response = requests.get(
+        response = self.session.get(
             url,
             params=params,
             data=body,
@@ -428,7 +435,7 @@ class EcomAPI(BaseEcomApi):
         if billing_address_id is not None:
             body['billing_address_id'] = billing_address_id
 
-        response = requests.post(
+        response = self.session.post(
             url,
             params=params,
             data=body,
@@ -478,7 +485,7 @@ class EcomAPI(BaseEcomApi):
         if billing_address_id is not None:
             body['billing_address_id'] = billing_address_id
 
-        response = requests.post(
+        response = self.session.post(
             url,
             params=params,
             data=body,
@@ -512,7 +519,7 @@ class EcomAPI(BaseEcomApi):
         if access_token:
             headers['Authorization'] = 'Bearer %s' % access_token
 
-        response = requests.delete(
+        response = self.session.delete(
             url,
             params=params,
             data=body,
@@ -549,7 +556,7 @@ class EcomAPI(BaseEcomApi):
         if access_token:
             headers['Authorization'] = 'Bearer %s' % access_token
 
-        response = requests.delete(
+        response = self.session.delete(
             url,
             params=params,
             data=body,
@@ -583,7 +590,7 @@ class EcomAPI(BaseEcomApi):
         if access_token:
             headers['Authorization'] = 'Bearer %s' % access_token
 
-        response = requests.get(
+        response = self.session.get(
             url,
             params=params,
             data=body,
@@ -617,7 +624,7 @@ class EcomAPI(BaseEcomApi):
         if access_token:
             headers['Authorization'] = 'Bearer %s' % access_token
 
-        response = requests.get(
+        response = self.session.get(
             url,
             params=params,
             data=body,
@@ -665,7 +672,7 @@ class EcomAPI(BaseEcomApi):
         if number_of_billing_cycles is not None:
             body['number_of_billing_cycle'] = number_of_billing_cycles
 
-        response = requests.put(
+        response = self.session.put(
             url,
             params=params,
             data=body,
@@ -700,7 +707,7 @@ class EcomAPI(BaseEcomApi):
         if access_token:
             headers['Authorization'] = 'Bearer %s' % access_token
 
-        response = requests.get(
+        response = self.session.get(
             url,
             params=params,
             data=body,
@@ -752,7 +759,7 @@ class EcomAPI(BaseEcomApi):
         if billing_address_id is not None:
             body['billing_address_id'] = billing_address_id
 
-        response = requests.put(
+        response = self.session.put(
             url,
             params=params,
             data=body,
@@ -790,7 +797,7 @@ class EcomAPI(BaseEcomApi):
         if access_token:
             headers['Authorization'] = 'Bearer %s' % access_token
 
-        response = requests.get(
+        response = self.session.get(
             url,
             params=params,
             data=body,
@@ -824,7 +831,7 @@ class EcomAPI(BaseEcomApi):
         if access_token:
             headers['Authorization'] = 'Bearer %s' % access_token
 
-        response = requests.get(
+        response = self.session.get(
             url,
             params=params,
             data=body,
@@ -863,7 +870,7 @@ class EcomAPI(BaseEcomApi):
         if access_token:
             headers['Authorization'] = 'Bearer %s' % access_token
 
-        response = requests.get(
+        response = self.session.get(
             url,
             params=params,
             data=body,
@@ -916,7 +923,7 @@ class EcomAPI(BaseEcomApi):
         if number_of_billing_cycles is not None:
             body['number_of_billing_cycle'] = number_of_billing_cycles
 
-        response = requests.put(
+        response = self.session.put(
             url,
             params=params,
             data=body,
@@ -955,7 +962,7 @@ class EcomAPI(BaseEcomApi):
         if access_token:
             headers['Authorization'] = 'Bearer %s' % access_token
 
-        response = requests.get(
+        response = self.session.get(
             url,
             params=params,
             data=body,
@@ -1014,7 +1021,7 @@ class EcomAPI(BaseEcomApi):
         if billing_address_id:
             body['billing_address_id'] = billing_address_id
 
-        response = requests.put(
+        response = self.session.put(
             url,
             params=params,
             data=body,
@@ -1053,7 +1060,7 @@ class EcomAPI(BaseEcomApi):
         if access_token:
             headers['Authorization'] = 'Bearer %s' % access_token
 
-        response = requests.get(
+        response = self.session.get(
             url,
             params=params,
             data=body,
@@ -1088,7 +1095,7 @@ class EcomAPI(BaseEcomApi):
         if access_token:
             headers['Authorization'] = 'Bearer %s' % access_token
 
-        response = requests.get(
+        response = self.session.get(
             url,
             params=params,
             data=body,
@@ -1124,7 +1131,7 @@ class EcomAPI(BaseEcomApi):
         if access_token:
             headers['Authorization'] = 'Bearer %s' % access_token
 
-        response = requests.get(
+        response = self.session.get(
             url,
             params=params,
             data=body,
@@ -1156,7 +1163,7 @@ class EcomAPI(BaseEcomApi):
         if access_token:
             headers['Authorization'] = 'Bearer %s' % access_token
 
-        response = requests.get(
+        response = self.session.get(
             url,
             headers=headers
         )
@@ -1187,7 +1194,7 @@ class EcomAPI(BaseEcomApi):
         if access_token:
             headers['Authorization'] = 'Bearer %s' % access_token
 
-        response = requests.get(
+        response = self.session.get(
             url,
             headers=headers
         )
@@ -1224,7 +1231,7 @@ class EcomAPI(BaseEcomApi):
         if product_type_id:
             body['catalog_product_id'] = product_type_id
 
-        response = requests.post(
+        response = self.session.post(
             url,
             data=body,
             headers=headers
@@ -1264,7 +1271,7 @@ class EcomAPI(BaseEcomApi):
         if product_type_id:
             body['catalog_product_id'] = product_type_id
 
-        response = requests.post(
+        response = self.session.post(
             url,
             data=body,
             headers=headers
@@ -1303,7 +1310,7 @@ class EcomAPI(BaseEcomApi):
         if access_token:
             headers['Authorization'] = 'Bearer %s' % access_token
 
-        response = requests.put(
+        response = self.session.put(
             url,
             data=body,
             headers=headers
@@ -1344,7 +1351,7 @@ class EcomAPI(BaseEcomApi):
         if access_token:
             headers['Authorization'] = 'Bearer %s' % access_token
 
-        response = requests.put(
+        response = self.session.put(
             url,
             data=body,
             headers=headers
@@ -1361,6 +1368,55 @@ class EcomAPI(BaseEcomApi):
 
         return response
 
+    def wait_for_items(self, list_items, predicate=None, timeout=60, initial_interval=0.5, max_interval=5.0):
+        """
+        Polls a listing until it contains at least one item matching the predicate (see framework.api.polling for how
+        the interval between polls adapts). Polls are conditional GETs (If-None-Match), so an unchanged listing isn't
+        downloaded or decoded again.
+        :param list_items: Callable that requests the listing (e.g. functools.partial(ecom_api.get_me_orders, token))
+        :param predicate: Callable that takes a decoded item and returns True if it's the one being waited for (any
+        item matches if None)
+        :param timeout: Number of seconds to wait before giving up
+        :param initial_interval: Number of seconds to wait between polls at first
+        :param max_interval: Maximum number of seconds to wait between polls
+        :return: List of the matching items
+        """
+        cache = ResponseCache(ttl=0, max_entries=1)  # Only used to revalidate the last response
+        last = {'content': None}
+
+        def poll():
+            with cache_policy(cache, 0, 'EcomAPI.wait_for_items'):
+                response = list_items()
+
+            if getattr(response, 'from_cache', False) or response.content == last['content']:
+                return None, False  # Unchanged since the last poll, so still no match
+            last['content'] = response.content
+
+            items = [item for item in response.json()['items'] if predicate is None or predicate(item)]
+            return items or None, True
+
+        description = getattr(list_items, 'func', list_items).__name__
+        try:
+            return wait_until(poll, timeout, initial_interval, max_interval, description='items from %s' % description)
+        except WaitTimeout as e:
+            raise EcomException(str(e))
+
+    def wait_for_me_orders(self, access_token, predicate=None, order_status=None, timeout=60):
+        """
+        Waits for the logged in user to have an order matching the predicate (see wait_for_items).
+        :return: List of the matching orders
+        """
+        return self.wait_for_items(
+            functools.partial(self.get_me_orders, access_token, order_status=order_status), predicate, timeout
+        )
+
+    def wait_for_me_subscriptions(self, access_token, predicate=None, timeout=60):
+        """
+        Waits for the logged in user to have a subscription matching the predicate (see wait_for_items).
+        :return: List of the matching subscriptions
+        """
+        return self.wait_for_items(functools.partial(self.get_me_subscriptions, access_token), predicate, timeout)
+
     def create_or_get_order(self, user, access_token, create_order_for_user):
         """
         Get one of the default user's orders if possible, and if not, create a new one
@@ -1374,7 +1430,7 @@ class EcomAPI(BaseEcomApi):
             order = all_orders[0]
         else:
             create_order_for_user(user)
-            order = self.get_me_orders(access_token).json()['items'][0]
+            order = self.wait_for_me_orders(access_token)[0]  # Ecom may take a moment to record the order
 
         return order
 
@@ -1391,10 +1447,83 @@ class EcomAPI(BaseEcomApi):
             subscription = subscriptions[0]
         else:
             create_dj_suite_subscription_for_user(user)
-            subscription = self.get_me_subscriptions(access_token_profile).json()['items'][0]
+            subscription = self.wait_for_me_subscriptions(access_token_profile)[0]
 
         return subscription
 
+    def list_me_orders(self, access_token, order_status=None):
+        """
+        :return: List of the logged in user's orders, as Order models
+        """
+        return Order.list_from(self.get_me_orders(access_token, order_status=order_status).json()['items'])
+
+    def list_user_orders(self, access_token, user_id=None, order_status=None):
+        """
+        :return: List of the given user's orders, as Order models
+        """
+        return Order.list_from(
+            self.get_user_orders(access_token, user_id=user_id, order_status=order_status).json()['items']
+        )
+
+    def list_me_subscriptions(self, access_token):
+        """
+        :return: List of the logged in user's subscriptions, as Subscription models
+        """
+        return Subscription.list_from(self.get_me_subscriptions(access_token).json()['items'])
+
+    def list_user_subscriptions(self, access_token, user_id=None):
+        """
+        :return: List of the given user's subscriptions, as Subscription models
+        """
+        return Subscription.list_from(self.get_user_subscriptions(access_token, user_id=user_id).json()['items'])
+
+    def list_me_payment_methods(self, access_token):
+        """
+        :return: List of the logged in user's payment methods, as PaymentMethod models
+        """
+        return PaymentMethod.list_from(self.get_me_payment_methods(access_token).json()['items'])
+
+    def list_user_payment_methods(self, access_token, user_id=None):
+        """
+        :return: List of the given user's payment methods, as PaymentMethod models
+        """
+        return PaymentMethod.list_from(self.get_user_payment_methods(access_token, user_id=user_id).json()['items'])
+
+    def get_user_snapshot(self, access_token, user_id=None, order_status=None, timeout=30):
+        """
+        Fetches a user's subscriptions, payment methods and orders in parallel.
+        :param access_token: Access token of the logged in user
+        :param user_id: ID of the user to fetch the snapshot for
+        :param order_status: Status of orders to fetch (complete, pending_payment, cancel, fraud)
+        :param timeout: Number of seconds to wait for each read
+        :return: EcomSnapshot. Reads that fail don't stop the others: check snapshot.errors (or call
+        snapshot.raise_for_errors()).
+        """
+        return self._snapshot(timeout, {
+            'subscriptions': functools.partial(self.get_user_subscriptions, access_token, user_id=user_id),
+            'payment_methods': functools.partial(self.get_user_payment_methods, access_token, user_id=user_id),
+            'orders': functools.partial(self.get_user_orders, access_token, user_id=user_id, order_status=order_status)
+        })
+
+    def get_me_snapshot(self, access_token, order_status=None, timeout=30):
+        """
+        Fetches the logged in user's subscriptions, payment methods and orders in parallel (see get_user_snapshot).
+        """
+        return self._snapshot(timeout, {
+            'subscriptions': functools.partial(self.get_me_subscriptions, access_token),
+            'payment_methods': functools.partial(self.get_me_payment_methods, access_token),
+            'orders': functools.partial(self.get_me_orders, access_token, order_status=order_status)
+        })
+
+    @staticmethod
+    def _snapshot(timeout, reads):
+        def items(read):
+            return lambda: read().json()['items']
+
+        start = default_timer()
+        results, errors = fan_out(dict((part, items(read)) for part, read in reads.items()), timeout=timeout)
+        return EcomSnapshot(results, errors, default_timer() - start)
+
     def delete_me_subscription(
         self,
         access_token,
@@ -1418,7 +1547,7 @@ class EcomAPI(BaseEcomApi):
         if access_token:
             headers['Authorization'] = 'Bearer %s' % access_token
 
-        response = requests.delete(
+        response = self.session.delete(
             url,
             params=params,
             data=body,
@@ -1462,7 +1591,7 @@ class EcomAPI(BaseEcomApi):
         if access_token:
             headers['Authorization'] = 'Bearer %s' % access_token
 
-        response = requests.delete(
+        response = self.session.delete(
             url,
             params=params,
             data=body,
@@ -1479,6 +1608,38 @@ class EcomAPI(BaseEcomApi):
         return response
 
 
+class EcomSnapshot(object):
+    """
+    A user's subscriptions, payment methods and orders (lists of decoded items), fetched at the same time. Lists that
+    couldn't be fetched are None, and the reasons are in `errors`.
+    """
+    __slots__ = ('subscriptions', 'payment_methods', 'orders', 'errors', 'elapsed')
+
+    PARTS = ('subscriptions', 'payment_methods', 'orders')
+
+    def __init__(self, results, errors, elapsed):
+        """
+        :param results: dict of part name (see PARTS) -> list of items
+        :param errors: dict of part name -> exception, for the parts that couldn't be fetched
+        :param elapsed: Number of seconds taken to fetch the snapshot
+        """
+        self.subscriptions = results.get('subscriptions')
+        self.payment_methods = results.get('payment_methods')
+        self.orders = results.get('orders')
+        self.errors = errors
+        self.elapsed = elapsed
+
+    @property
+    def complete(self):
+        return not self.errors
+
+    def raise_for_errors(self):
+        if self.errors:
+            raise EcomException('Failed to fetch %s' % '; '.join(
+                '%s (%s)' % (part, self.errors[part]) for part in self.PARTS if part in self.errors
+            ))
+
+
 class EcomException(Exception):
     """
     Generic error thrown when unexpected results are received from the Ecom service
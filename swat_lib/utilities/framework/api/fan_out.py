@@ -0,0 +1,58 @@
+"""
+Runs independent API calls in parallel, so that the latency of a group of reads is that of the slowest call rather than
+the sum of all of them.
+
+E.g.
+
+    results, errors = fan_out({
+        'subscriptions': functools.partial(ecom_api.get_user_subscriptions, access_token, user_id=user_id),
+        'orders': functools.partial(ecom_api.get_user_orders, access_token, user_id=user_id),
+    }, timeout=10)
+
+A call that fails (or doesn't finish within the timeout) doesn't affect the others: its exception is returned in
+`errors` instead.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+class FanOutTimeout(Exception):
+    """
+    Returned (in the errors of fan_out) for a call that didn't finish within the timeout.
+    """
+    def __init__(self, name, timeout):
+        super(FanOutTimeout, self).__init__('%s did not finish within %s seconds' % (name, timeout))
+        self.name = name
+        self.timeout = timeout
+
+
+def fan_out(calls, timeout=None):
+    """
+    :param calls: dict of name -> callable taking no arguments (e.g. a functools.partial of an API wrapper method)
+    :param timeout: Number of seconds to wait for each call (they all start at once, so this is also the maximum
+    total time). Calls still running after this are abandoned, rather than cancelled: requests can't be interrupted.
+    :return: (results, errors) tuple: dicts of name -> return value for the calls that succeeded, and name -> exception
+    for the calls that failed
+    """
+    results = {}
+    errors = {}
+    if not calls:
+        return results, errors
+
+    executor = ThreadPoolExecutor(max_workers=len(calls))
+    try:
+        futures = dict((executor.submit(call), name) for name, call in calls.items())
+        done, not_done = wait(futures, timeout=timeout)
+
+        for future in done:
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                errors[name] = e
+
+        for future in not_done:
+            errors[futures[future]] = FanOutTimeout(futures[future], timeout)
+    finally:
+        executor.shutdown(wait=False)  # Don't block on abandoned calls
+
+    return results, errors
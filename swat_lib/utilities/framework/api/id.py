@@ -1,9 +1,8 @@
 import urlparse
 from datetime import datetime
 
-import requests
-
-from framework.api.base import ResponseException, MetaApi
+from framework.api.base import ResponseException, MetaApi, create_session
+from framework.api.retry import retry_non_idempotent
 from framework.models import User
 
 
@@ -14,6 +13,7 @@ class BaseIdApi(object):
     __metaclass__ = MetaApi
 
     logger = None
+    retry_policy = None  # framework.api.retry.RetryPolicy (the default policy is used if None)
 
     def get_user(self, email):
         """
@@ -91,19 +91,21 @@ class IdApi(BaseIdApi):
     them as close as possible to 'pseudocode.'
     """
 
-    def __init__(self, base_url, auth_appname, auth_password, urls, logger=None):
+    def __init__(self, base_url, auth_appname, auth_password, urls, logger=None, session=None):
         """
         :param base_url: Base URL of the ID service (for a specific stack)
         :param auth_appname: Basic auth user ID (client-app-specific)
         :param auth_password: Plaintext password for the basic auth user
         :param urls: URLS for the ID service's endpoints (from the configuration object)
         :param logger: Optional logger instance (Log from framework.log). For logging requests/responses
+        :param session: Optional requests Session to make requests with (e.g. to share a connection pool)
         """
         self.base_url = base_url
         self.auth_appname = auth_appname
         self.auth_password = auth_password
         self.urls = urls
         self.logger = logger
+        self.session = session or create_session()
 
     def get_user_id_if_exists(self, email):
         """
@@ -136,7 +138,7 @@ class IdApi(BaseIdApi):
             'ga_client_id': ga_client_id
         }
 
-        response = requests.get(
+        response = self.session.get(
             url,
             params=params,
             auth=(self.auth_appname, self.auth_password)
@@ -169,7 +171,7 @@ class IdApi(BaseIdApi):
             'ga_client_id': ga_client_id
         }
 
-        response = requests.post(
+        response = self.session.post(
             url,
             data=body,
             headers=headers,
@@ -206,7 +208,7 @@ class IdApi(BaseIdApi):
             'locale': locale
         }
 
-        response = requests.post(
+        response = self.session.post(
             url,
             data=body,
             auth=(self.auth_appname, self.auth_password)
@@ -234,6 +236,7 @@ class IdApi(BaseIdApi):
 
         return User(user_id, email, password)
 
+    @retry_non_idempotent  # A repeated login just issues another set of tokens
     def login(self, email, password, device_id=None, device_name=None):
 
         url = urlparse.urljoin(self.base_url, self.urls.login)
@@ -245,7 +248,7 @@ class IdApi(BaseIdApi):
             'device_name': device_name
         }
 
-        response = requests.post(
+        response = self.session.post(
             url,
             data=body,
             auth=(self.auth_appname, self.auth_password)
@@ -276,7 +279,7 @@ class IdApi(BaseIdApi):
             'refresh_token': refresh_token
         }
 
-        response = requests.post(
+        response = self.session.post(
             url,
             params=params,
             data=body
@@ -312,7 +315,7 @@ class IdApi(BaseIdApi):
 
         body = {}
 
-        response = requests.get(
+        response = self.session.get(
             url,
             data=body,
             headers=headers
@@ -338,7 +341,7 @@ class IdApi(BaseIdApi):
             'redirect_uri': redirect_uri
         }
 
-        response = requests.post(
+        response = self.session.post(
             url,
             data=body,
             headers=headers
@@ -364,7 +367,7 @@ class IdApi(BaseIdApi):
             'redirect_uri': redirect_uri
         }
 
-        response = requests.post(
+        response = self.session.post(
             url,
             data=body,
             headers=headers
@@ -385,7 +388,7 @@ class IdApi(BaseIdApi):
             'refresh_token': refresh_token
         }
 
-        response = requests.post(
+        response = self.session.post(
             url,
             data=body
         )
@@ -407,7 +410,7 @@ class IdApi(BaseIdApi):
             'redirect_uri': redirect_uri
         }
 
-        response = requests.post(
+        response = self.session.post(
             url,
             data=body,
             auth=(self.auth_appname, self.auth_password)
@@ -428,7 +431,7 @@ class IdApi(BaseIdApi):
             'email_address': email_address
         }
 
-        response = requests.post(
+        response = self.session.post(
             url,
             data=body,
             auth=(self.auth_appname, self.auth_password)
@@ -456,7 +459,7 @@ class IdApi(BaseIdApi):
             'Accept': 'application/json',
             'authorization': 'Bearer %s' % access_token
         }
-        response = requests.delete(
+        response = self.session.delete(
             url,
             data=body,
             headers=headers
@@ -0,0 +1,68 @@
+"""
+JSON decoding for API responses.
+
+Each response body tends to be decoded several times: by the wrapper method checking it, by the response logging (see
+framework.log.LogFormat.format_response), and by the caller. Sessions from framework.api.base.create_session add
+decode_once as a response hook, so that the body is decoded the first time response.json() is called, and every later
+call returns the same object. (So callers shouldn't modify the decoded JSON in place if anything else might use it.)
+
+Bodies are decoded with the fastest available backend: orjson or ujson if installed, otherwise the standard library's
+json. Use set_backend to choose one explicitly.
+"""
+import functools
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+BACKENDS = dict(
+    (name, module.loads) for name, module in (('orjson', orjson), ('ujson', ujson), ('json', json)) if module
+)
+
+backend = next(name for name in ('orjson', 'ujson', 'json') if name in BACKENDS)
+loads = BACKENDS[backend]
+
+
+def set_backend(name):
+    """
+    :param name: 'orjson', 'ujson' or 'json' (the backend must be installed)
+    """
+    global backend, loads
+    if name not in BACKENDS:
+        raise ValueError('JSON backend %r is not installed (available: %s)' % (name, ', '.join(sorted(BACKENDS))))
+    backend = name
+    loads = BACKENDS[name]
+
+
+def decode_once(response, *args, **kwargs):
+    """
+    requests response hook that makes response.json() decode the body only once (with the selected backend).
+    """
+    response.json = functools.partial(cached_json, response)
+    return response
+
+
+def cached_json(response, **kwargs):
+    """
+    :param response: requests Response
+    :param kwargs: Arguments for json.loads. If any are given, the body is decoded by requests as normal (and the result
+    isn't cached).
+    :return: The decoded body
+    :raises ValueError: If the body isn't valid JSON
+    """
+    if kwargs:
+        return type(response).json(response, **kwargs)
+
+    try:
+        return response._json
+    except AttributeError:
+        response._json = loads(response.content)
+        return response._json
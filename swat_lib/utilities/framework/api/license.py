@@ -1,6 +1,8 @@
 import urlparse
-import requests
-from framework.api.base import ResponseException, MetaApi
+from framework.api.base import ResponseException, MetaApi, create_session
+from framework.api.cache import cacheable
+from framework.api.streaming import iter_json_items
+from framework.models import License, Product
 
 
 class BaseLicenseApi(object):
@@ -10,6 +12,129 @@ class BaseLicenseApi(object):
     __metaclass__ = MetaApi
 
     logger = None
+    retry_policy = None  # framework.api.retry.RetryPolicy (the default policy is used if None)
+    response_cache = None  # framework.api.cache.ResponseCache (responses aren't cached if None)
+
+    def get_me_licenses(self, access_token=None, app_name=None, term=None, stream=False):
+        """
+        /me/licenses (GET)
+        :param stream: Whether to download the body as it's read, rather than straight away. The caller must then close
+        the response (or read all of it), otherwise its connection is never released; prefer iter_me_licenses.
+        """
+        raise NotImplementedError
+
+    def get_user_id_licenses(self, access_token=None, user_id=None, app_name=None, term=None):
+        """
+        /users/{user_id}/licenses (GET)
+        """
+        raise NotImplementedError
+
+    def get_user_id_products(self, access_token=None, user_id=None, app_name=None, term=None, stream=False):
+        """
+        /users/{user_id}/products (GET)
+        :param stream: Whether to download the body as it's read, rather than straight away. The caller must then close
+        the response (or read all of it), otherwise its connection is never released; prefer iter_user_id_products.
+        """
+        raise NotImplementedError
+
+    def get_me_products(self, access_token=None, user_id=None, app_name=None, term=None):
+        """
+        /me/products (GET)
+        """
+        raise NotImplementedError
+
+    def post_me_products(self, access_token, host_machine_id=None, product_type_id=None, product_serial_number=None):
+        """
+        /me/products (POST)
+        """
+        raise NotImplementedError
+
+    def post_user_products(self, access_token, user_id=None, host_machine_id=None, product_type_id=None,
+                           product_serial_number=None):
+        """
+        /users/{user_id}/products (POST)
+        """
+        raise NotImplementedError
+
+    def get_product_types(self, access_token, term=None, app_name=None, stream=False):
+        """
+        /products/types (GET)
+        :param stream: Whether to download the body as it's read, rather than straight away. The caller must then close
+        the response (or read all of it), otherwise its connection is never released; prefer iter_product_types.
+        """
+        raise NotImplementedError
+
+    def get_product_types_by_product_type_id(self, access_token, product_type_id=None):
+        """
+        /products/types/{product_type_id} (GET)
+        """
+        raise NotImplementedError
+
+    def post_products_types_with_valid_reset_date(self, product_type_id, reset_date):
+        """
+        /products/types/{product_type_id}/trialresets (POST)
+        """
+        raise NotImplementedError
+
+    def get_products_products(self, user_id, stream=False):
+        """
+        /products/products (GET)
+        :param stream: Whether to download the body as it's read, rather than straight away. The caller must then close
+        the response (or read all of it), otherwise its connection is never released; prefer iter_products_products.
+        """
+        raise NotImplementedError
+
+    def post_products_products(self, user_id=None, user_email_address=None, product_type_id=None, valid_to=None,
+                               magento_order_id=None, magento_order_item_id=None, subscription_status=None):
+        """
+        /products/products (POST)
+        """
+        raise NotImplementedError
+
+    def delete_products_products_id(self, product_id=None):
+        """
+        /products/products/{product_id} (DELETE)
+        """
+        raise NotImplementedError
+
+    def get_products_products_id(self, product_id=None):
+        """
+        /products/products/{product_id} (GET)
+        """
+        raise NotImplementedError
+
+    def put_products_products_id(self, product_id=None, subscription_status=None):
+        """
+        /products/products/{product_id} (PUT)
+        """
+        raise NotImplementedError
+
+    def me_licenses_authorizations(self, access_token=None, action=None, app_name=None, app_version=None,
+                                   host_machine_id=None, host_machine_name=None, license_id=None, system_time=None):
+        """
+        /me/licenses/authorizations (POST)
+        """
+        raise NotImplementedError
+
+    def put_me_licenses_authorizations(self, access_token=None, authorization_id=None, status_code=None):
+        """
+        /me/licenses/authorizations/{authorization_id} (PUT)
+        """
+        raise NotImplementedError
+
+    def put_users_licenses_authorizations(self, access_token=None, user_id=None, authorization_id=None, status_code=None):
+        """
+        /users/{user_id}/licenses/authorizations/{authorization_id} (PUT)
+        """
+        raise NotImplementedError
+
+    def user_licenses_authorizations(self, access_token=None, user_id=None, action=None, app_name=None,
+                                     app_version=None, host_machine_id=None, host_machine_name=None,
+                                     license_id=None, system_time=None):
+        """
+        /users/{user_id}/licenses/authorizations (POST)
+        """
+        raise NotImplementedError
 
 
 class LicenseApi(BaseLicenseApi):
@@ -21,21 +146,26 @@ class LicenseApi(BaseLicenseApi):
     them as close as possible to 'pseudocode.'
     """
 
-    def __init__(self, base_url, auth_appname, auth_password, urls, logger=None):
+    def __init__(self, base_url, auth_appname, auth_password, urls, logger=None, session=None, response_cache=None):
         """
         :param base_url: Base URL of the ID service (for a specific stack)
         :param auth_appname: Basic auth user ID (client-app-specific)
         :param auth_password: Plaintext password for the basic auth user
         :param urls: URLS for the ID service's endpoints (from the configuration object)
         :param logger: Optional logger instance (Log from framework.log). For logging requests/responses
+        :param session: Optional requests Session to make requests with (e.g. to share a connection pool)
+        :param response_cache: Optional ResponseCache (from framework.api.cache) to serve reference data (e.g. product
+        types) from, rather than requesting it every time. Only used with sessions from create_session.
         """
         self.base_url = base_url
         self.auth_appname = auth_appname
         self.auth_password = auth_password
         self.urls = urls
         self.logger = logger
+        self.session = session or create_session()
+        self.response_cache = response_cache
 
-    def get_me_licenses(self, access_token=None, app_name=None, term=None):
+    def get_me_licenses(self, access_token=None, app_name=None, term=None, stream=False):
         url = urlparse.urljoin(self.base_url, self.urls.me_licenses)
 
         params = {}
@@ -51,11 +181,12 @@ class LicenseApi(BaseLicenseApi):
 
         body = {}
 
-        response = requests.get(
+        response = self.session.get(
             url,
             params=params,
             data=body,
-            headers=headers
+            headers=headers,
+            stream=stream
         )
 
         if response.status_code != 200:
@@ -82,7 +213,7 @@ class LicenseApi(BaseLicenseApi):
 
         body = {}
 
-        response = requests.get(
+        response = self.session.get(
             url,
             params=params,
             data=body,
@@ -98,7 +229,7 @@ class LicenseApi(BaseLicenseApi):
 
         return response
 
-    def get_user_id_products(self, access_token=None, user_id=None, app_name=None, term=None):
+    def get_user_id_products(self, access_token=None, user_id=None, app_name=None, term=None, stream=False):
         url = urlparse.urljoin(self.base_url, self.urls.user_id_products.format(user_id=user_id))
 
         params = {}
@@ -114,11 +245,12 @@ class LicenseApi(BaseLicenseApi):
 
         body = {}
 
-        response = requests.get(
+        response = self.session.get(
             url,
             params=params,
             data=body,
-            headers=headers
+            headers=headers,
+            stream=stream
         )
 
         if response.status_code != 200:
@@ -149,7 +281,7 @@ class LicenseApi(BaseLicenseApi):
 
         body = {}
 
-        response = requests.get(
+        response = self.session.get(
             url,
             params=params,
             data=body,
@@ -182,7 +314,7 @@ class LicenseApi(BaseLicenseApi):
             'authorization': 'Bearer %s' % access_token
         }
 
-        response = requests.post(
+        response = self.session.post(
             url,
             params=params,
             headers=headers,
@@ -216,7 +348,7 @@ class LicenseApi(BaseLicenseApi):
             'authorization': 'Bearer %s' % access_token
         }
 
-        response = requests.post(
+        response = self.session.post(
             url,
             params=params,
             headers=headers,
@@ -232,7 +364,8 @@ class LicenseApi(BaseLicenseApi):
 
         return response
 
-    def get_product_types(self, access_token, term=None, app_name=None):
+    @cacheable()
+    def get_product_types(self, access_token, term=None, app_name=None, stream=False):
         url = urlparse.urljoin(self.base_url, self.urls.product_types)
 
         params = {}
@@ -249,11 +382,12 @@ class LicenseApi(BaseLicenseApi):
 
         body = {}
 
-        response = requests.get(
+        response = self.session.get(
             url,
             params=params,
             data=body,
-            headers=headers
+            headers=headers,
+            stream=stream
         )
 
         if response.status_code != 200:
@@ -264,6 +398,7 @@ class LicenseApi(BaseLicenseApi):
 
         return response
 
+    @cacheable()
     def get_product_types_by_product_type_id(self, access_token, product_type_id=None):
         url = urlparse.urljoin(self.base_url,
                                self.urls.product_types_product_type_id.format(product_type_id=product_type_id))
@@ -275,7 +410,7 @@ class LicenseApi(BaseLicenseApi):
 
         body = {}
 
-        response = requests.get(
+        response = self.session.get(
             url,
             data=body,
             headers=headers
@@ -304,7 +439,7 @@ class LicenseApi(BaseLicenseApi):
             'Accept': 'application/json'
         }
 
-        response = requests.post(
+        response = self.session.post(
             url,
             params=params,
             headers=headers,
@@ -321,17 +456,18 @@ class LicenseApi(BaseLicenseApi):
 
         return response
 
-    def get_products_products(self, user_id):
+    def get_products_products(self, user_id, stream=False):
         url = urlparse.urljoin(self.base_url, self.urls.product_products)
 
         params = {}
         if user_id:
             params['user_id'] = user_id
 
-        response = requests.get(
+        response = self.session.get(
             url,
             params=params,
-            auth=(self.auth_appname, self.auth_password)
+            auth=(self.auth_appname, self.auth_password),
+            stream=stream
         )
 
         if response.status_code != 200:
@@ -366,7 +502,7 @@ class LicenseApi(BaseLicenseApi):
         if subscription_status:
             body['subscription_status'] = subscription_status
 
-        response = requests.post(
+        response = self.session.post(
             url,
             data=body,
             headers=headers,
@@ -392,7 +528,7 @@ class LicenseApi(BaseLicenseApi):
             'Accept': 'application/json'
         }
 
-        response = requests.delete(
+        response = self.session.delete(
             url,
             params=params,
             headers=headers,
@@ -419,7 +555,7 @@ class LicenseApi(BaseLicenseApi):
             'Accept': 'application/json'
         }
 
-        response = requests.get(
+        response = self.session.get(
             url,
             params=params,
             headers=headers,
@@ -450,7 +586,7 @@ class LicenseApi(BaseLicenseApi):
         if subscription_status:
             body['subscription_status'] = subscription_status
 
-        response = requests.put(
+        response = self.session.put(
             url,
             params=params,
             headers=headers,
@@ -489,7 +625,7 @@ class LicenseApi(BaseLicenseApi):
         if license_id != None: body['license_id'] = license_id
         if system_time != None: body['system_time'] = system_time
 
-        response = requests.post(
+        response = self.session.post(
             url,
             params=params,
             data=body,
@@ -520,7 +656,7 @@ class LicenseApi(BaseLicenseApi):
         body = {}
         if status_code != None: body['status_code'] = status_code
 
-        response = requests.put(
+        response = self.session.put(
             url,
             params=params,
             data=body,
@@ -553,7 +689,7 @@ class LicenseApi(BaseLicenseApi):
         body = {}
         if status_code != None: body['status_code'] = status_code
 
-        response = requests.put(
+        response = self.session.put(
             url,
             params=params,
             data=body,
@@ -590,7 +726,7 @@ class LicenseApi(BaseLicenseApi):
         if license_id != None: body['license_id'] = license_id
         if system_time != None: body['system_time'] = system_time
 
-        response = requests.post(
+        response = self.session.post(
             url,
             params=params,
             data=body,
@@ -605,6 +741,62 @@ class LicenseApi(BaseLicenseApi):
 
         return response
 
+    def iter_me_licenses(self, access_token=None, app_name=None, term=None, as_models=False):
+        """
+        Yields the user's licenses one at a time, decoding the response body as it's downloaded (see
+        framework.api.streaming). Stopping early means the rest of the body isn't downloaded.
+
+        The request is only made once iteration starts, and its connection is released once iteration finishes or the
+        generator is closed. To stop early, close the generator (e.g. with contextlib.closing) rather than leaving it
+        for the garbage collector.
+        :param as_models: Whether to yield License models (from framework.models) rather than dictionaries
+        """
+        response = self.get_me_licenses(access_token, app_name=app_name, term=term, stream=True)
+        try:
+            for item in iter_json_items(response, model=License if as_models else None):
+                yield item
+        finally:
+            response.close()
+
+    def iter_user_id_products(self, access_token=None, user_id=None, app_name=None, term=None, as_models=False):
+        """
+        Yields the given user's products one at a time, decoding the response body as it's downloaded (closing it as in
+        iter_me_licenses).
+        :param as_models: Whether to yield Product models (from framework.models) rather than dictionaries
+        """
+        response = self.get_user_id_products(access_token, user_id=user_id, app_name=app_name, term=term, stream=True)
+        try:
+            for item in iter_json_items(response, model=Product if as_models else None):
+                yield item
+        finally:
+            response.close()
+
+    def iter_products_products(self, user_id, as_models=False):
+        """
+        Yields the given user's products (via the admin endpoint) one at a time, decoding the response body as it's
+        downloaded (closing it as in iter_me_licenses).
+        :param as_models: Whether to yield Product models (from framework.models) rather than dictionaries
+        """
+        response = self.get_products_products(user_id, stream=True)
+        try:
+            for item in iter_json_items(response, model=Product if as_models else None):
+                yield item
+        finally:
+            response.close()
+
+    def iter_product_types(self, access_token, term=None, app_name=None):
+        """
+        Yields product types one at a time, decoding the response body as it's downloaded (closing it as in
+        iter_me_licenses).
+        """
+        response = self.get_product_types(access_token, term=term, app_name=app_name, stream=True)
+        try:
+            for item in iter_json_items(response):
+                yield item
+        finally:
+            response.close()
+
+
 class LicenseException(Exception):
     """
     Generic error thrown when unexpected results are received from the ID service
@@ -0,0 +1,284 @@
+"""
+Low-overhead instrumentation for the API wrappers.
+
+Every call made through a MetaApi-wrapped method is recorded here (see framework.api.base), so that at the end of a
+session we can see which ID/ecom/license calls dominate suite time. Timings are kept in HDR-style histograms, which
+record values into logarithmically-sized buckets: recording is a couple of integer operations, memory use is bounded
+no matter how many calls are made, and percentiles are accurate to within a few percent.
+"""
+import json
+import threading
+from collections import defaultdict
+
+
+class Histogram(object):
+    """
+    HDR-style histogram of non-negative integer values (e.g. microseconds or bytes).
+
+    Values below 2 ** (SUB_BUCKET_BITS + 1) are recorded exactly. Above that, each power of two is split into
+    2 ** SUB_BUCKET_BITS linear sub-buckets, so the relative error of a recorded value is at most 1 / 2 ** SUB_BUCKET_BITS
+    (about 3% with the default of 5 bits).
+    """
+    SUB_BUCKET_BITS = 5
+
+    def __init__(self):
+        self.buckets = defaultdict(int)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    @classmethod
+    def bucket_index(cls, value):
+        """
+        :param value: Non-negative int
+        :return: Index of the bucket the value belongs in
+        """
+        shift = value.bit_length() - (cls.SUB_BUCKET_BITS + 1)
+        if shift <= 0:
+            return value
+        return (shift << cls.SUB_BUCKET_BITS) + (value >> shift)
+
+    @classmethod
+    def bucket_bounds(cls, index):
+        """
+        :param index: Bucket index (see bucket_index)
+        :return: (lowest, highest) values that are recorded in the bucket with the given index
+        """
+        if index < 1 << (cls.SUB_BUCKET_BITS + 1):
+            return index, index
+        shift = (index >> cls.SUB_BUCKET_BITS) - 1
+        top = index - (shift << cls.SUB_BUCKET_BITS)
+        return top << shift, ((top + 1) << shift) - 1
+
+    def record(self, value):
+        value = max(int(value), 0)
+        self.buckets[self.bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """
+        :param percent: Percentile to calculate (0-100)
+        :return: Upper bound of the bucket containing the given percentile (or 0 if nothing has been recorded)
+        """
+        if not self.count:
+            return 0
+
+        threshold = self.count * percent / 100.0
+        seen = 0
+
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= threshold:
+                return min(self.bucket_bounds(index)[1], self.max)
+
+        return self.max
+
+    @property
+    def mean(self):
+        return float(self.total) / self.count if self.count else 0.0
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'min': self.min or 0,
+            'max': self.max or 0,
+            'mean': self.mean,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99)
+        }
+
+
+class EndpointStats(object):
+    """
+    Timings and sizes recorded for one API method and response status code.
+    """
+    TIMINGS = ('ttfb', 'total')
+
+    def __init__(self):
+        # Timings are recorded in microseconds, sizes in bytes
+        self.timings = dict((name, Histogram()) for name in self.TIMINGS)
+        self.request_bytes = Histogram()
+        self.response_bytes = Histogram()
+
+    def to_dict(self):
+        data = dict((name, histogram.to_dict()) for name, histogram in self.timings.items())
+        data['request_bytes'] = self.request_bytes.to_dict()
+        data['response_bytes'] = self.response_bytes.to_dict()
+        return data
+
+
+class ApiMetrics(object):
+    """
+    Thread-safe registry of per-endpoint statistics and named counters.
+
+    Endpoints are identified by '<ApiClass>.<method_name>', and split by response status code (or 'error' if no
+    response was received, e.g. on a connection error).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = defaultdict(EndpointStats)
+        self.counters = defaultdict(int)
+
+    def reset(self):
+        with self.lock:
+            self.endpoints.clear()
+            self.counters.clear()
+
+    def record_call(self, api_name, method_name, response, total_seconds):
+        """
+        Record one call to an API wrapper method.
+        :param api_name: Name of the API wrapper class (e.g. 'IdApi')
+        :param method_name: Name of the method that was called (e.g. 'get_user')
+        :param response: requests Response object, or None if no response was received
+        :param total_seconds: Wall clock time taken by the call, including downloading the body
+        """
+        endpoint = '%s.%s' % (api_name, method_name)
+        status = str(response.status_code) if response is not None else 'error'
+
+        if response is not None:
+            ttfb = response.elapsed.total_seconds()
+            request_bytes = request_size(response.request)
+            response_bytes = response_size(response)
+
+        with self.lock:
+            stats = self.endpoints[(endpoint, status)]
+            stats.timings['total'].record(total_seconds * 1e6)
+            self.counters[('requests', endpoint, status)] += 1
+
+            if response is not None:
+                stats.timings['ttfb'].record(ttfb * 1e6)
+                stats.request_bytes.record(request_bytes)
+                stats.response_bytes.record(response_bytes)
+
+    def increment(self, name, endpoint, amount=1):
+        """
+        Increment a named counter (e.g. 'retries') for an endpoint.
+        """
+        with self.lock:
+            self.counters[(name, endpoint, '')] += amount
+
+    def to_dict(self):
+        with self.lock:
+            endpoints = [
+                dict(endpoint=endpoint, status=status, **stats.to_dict())
+                for (endpoint, status), stats in sorted(self.endpoints.items())
+            ]
+            counters = [
+                {'name': name, 'endpoint': endpoint, 'status': status, 'value': value}
+                for (name, endpoint, status), value in sorted(self.counters.items())
+            ]
+        return {'endpoints': endpoints, 'counters': counters}
+
+    def summary_lines(self):
+        """
+        :return: Lines of a plain-text table summarising the recorded calls, slowest (by total time) first
+        """
+        data = self.to_dict()
+        rows = sorted(data['endpoints'], key=lambda row: row['total']['sum'], reverse=True)
+        row_format = '%-60s %6s %6s %9s %9s %9s %9s %10s'
+        lines = [row_format % ('Endpoint', 'Status', 'Calls', 'p50 ms', 'p90 ms', 'p99 ms', 'Total s', 'Avg resp B')]
+
+        for row in rows:
+            total = row['total']
+            lines.append(row_format % (
+                row['endpoint'][:60],
+                row['status'],
+                total['count'],
+                '%.1f' % (total['p50'] / 1e3),
+                '%.1f' % (total['p90'] / 1e3),
+                '%.1f' % (total['p99'] / 1e3),
+                '%.2f' % (total['sum'] / 1e6),
+                '%d' % row['response_bytes']['mean']
+            ))
+
+        # Other counters (e.g. retries), which aren't already covered by the table
+        counters = [counter for counter in data['counters'] if counter['name'] != 'requests']
+        if counters:
+            lines.append('')
+            for counter in counters:
+                lines.append('%-60s %-20s %g' % (counter['endpoint'][:60], counter['name'], counter['value']))
+
+        return lines
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, sort_keys=True, indent=2)
+
+    def write_prometheus(self, path):
+        """
+        Write the metrics in the Prometheus text exposition format (e.g. for node_exporter's textfile collector).
+        Histograms are exported as summaries (quantiles plus _sum and _count).
+        """
+        data = self.to_dict()
+        lines = []
+
+        metric = 'swat_api_request_duration_seconds'
+        lines.append('# TYPE %s summary' % metric)
+        for row in data['endpoints']:
+            labels = 'endpoint="%s",status="%s"' % (row['endpoint'], row['status'])
+            total = row['total']
+            for quantile in ('50', '90', '99'):
+                lines.append('%s{%s,quantile="0.%s"} %f' % (metric, labels, quantile, total['p' + quantile] / 1e6))
+            lines.append('%s_sum{%s} %f' % (metric, labels, total['sum'] / 1e6))
+            lines.append('%s_count{%s} %d' % (metric, labels, total['count']))
+
+        for name in ('request_bytes', 'response_bytes'):
+            metric = 'swat_api_%s' % name
+            lines.append('# TYPE %s summary' % metric)
+            for row in data['endpoints']:
+                labels = 'endpoint="%s",status="%s"' % (row['endpoint'], row['status'])
+                lines.append('%s_sum{%s} %d' % (metric, labels, row[name]['sum']))
+                lines.append('%s_count{%s} %d' % (metric, labels, row[name]['count']))
+
+        counter_names = sorted(set(counter['name'] for counter in data['counters']))
+        for name in counter_names:
+            metric = 'swat_api_%s_total' % name
+            lines.append('# TYPE %s counter' % metric)
+            for counter in data['counters']:
+                if counter['name'] == name:
+                    labels = 'endpoint="%s"' % counter['endpoint']
+                    if counter['status']:
+                        labels += ',status="%s"' % counter['status']
+                    lines.append('%s{%s} %s' % (metric, labels, counter['value']))
+
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+
+def request_size(request):
+    """
+    :param request: requests PreparedRequest
+    :return: Approximate size of the request on the wire (request line, headers and body) in bytes
+    """
+    size = len(request.method) + len(request.url) + 11  # ' ' + ' HTTP/1.1\r\n'
+    size += sum(len(k) + len(str(v)) + 4 for k, v in request.headers.items())
+    body = request.body
+    if body and not hasattr(body, 'read'):  # Streamed bodies (file-like objects) can't be measured
+        size += len(body)
+    return size
+
+
+def response_size(response):
+    """
+    :param response: requests Response
+    :return: Size of the response body in bytes, without reading a streamed body that hasn't been consumed yet
+    """
+    content_length = response.headers.get('Content-Length')
+    if content_length and content_length.isdigit():
+        return int(content_length)
+    if getattr(response, '_content_consumed', True):
+        return len(response.content or b'')
+    return 0
+
+
+# Shared by all API wrappers, so that a whole session's calls can be summarised in one place
+api_metrics = ApiMetrics()
@@ -0,0 +1,51 @@
+"""
+Polling for eventually-consistent state (e.g. an order showing up in ecom after a browser checkout), without guessing
+at sleep durations.
+
+The interval between polls adapts to what's being polled: while nothing changes it grows (up to a maximum), so a slow
+service isn't hammered, and as soon as something changes it drops back to the initial interval, since the state being
+waited for is often close behind. The interval never overshoots the deadline.
+"""
+import time
+
+
+class WaitTimeout(Exception):
+    """
+    Thrown by wait_until when the deadline passes before the condition is met.
+    """
+    def __init__(self, description, timeout, polls):
+        super(WaitTimeout, self).__init__(
+            'Timed out after %s seconds (%d polls) waiting for %s' % (timeout, polls, description)
+        )
+        self.timeout = timeout
+        self.polls = polls
+
+
+def wait_until(poll, timeout=60, initial_interval=0.5, max_interval=5.0, backoff=1.5, description='condition'):
+    """
+    Calls poll() until it returns a result.
+    :param poll: Callable returning a (result, changed) tuple: result is None if the condition hasn't been met yet, and
+    changed is whether the polled state has changed since the previous poll
+    :param timeout: Number of seconds to wait before giving up
+    :param initial_interval: Number of seconds to wait between polls at first (and after each change)
+    :param max_interval: Maximum number of seconds to wait between polls
+    :param backoff: Factor to increase the interval by after each poll in which nothing changed
+    :param description: Description of what's being waited for (for the WaitTimeout message)
+    :return: The result returned by poll
+    """
+    deadline = time.time() + timeout
+    interval = initial_interval
+    polls = 0
+
+    while True:
+        result, changed = poll()
+        polls += 1
+        if result is not None:
+            return result
+
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise WaitTimeout(description, timeout, polls)
+
+        interval = initial_interval if changed else min(interval * backoff, max_interval)
+        time.sleep(min(interval, remaining))
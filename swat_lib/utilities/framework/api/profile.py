@@ -1,6 +1,5 @@
 import urlparse
-import requests
-from framework.api.base import ResponseException, MetaApi
+from framework.api.base import ResponseException, MetaApi, create_session
 
 
 class BaseProfileApi(object):
@@ -10,6 +9,7 @@ class BaseProfileApi(object):
     __metaclass__ = MetaApi
 
     logger = None
+    retry_policy = None  # framework.api.retry.RetryPolicy (the default policy is used if None)
 
     def get_user_profile(self, user_id, access_token):
         """
@@ -41,19 +41,21 @@ class ProfileApi(BaseProfileApi):
     Wrapper for the profile service API.
     """
 
-    def __init__(self, base_url, auth_appname, auth_password, urls, logger=None):
+    def __init__(self, base_url, auth_appname, auth_password, urls, logger=None, session=None):
         """
         :param base_url: Base URL of the ID service (for a specific stack)
         :param auth_appname: Basic auth user ID (client-app-specific)
         :param auth_password: Plaintext password for the basic auth user
         :param urls: URLS for the ID service's endpoints (from the configuration object)
         :param logger: Optional logger instance (Log from framework.log). For logging requests/responses
+        :param session: Optional requests Session to make requests with (e.g. to share a connection pool)
         """
         self.base_url = base_url
         self.auth_appname = auth_appname
         self.auth_password = auth_password
         self.urls = urls
         self.logger = logger
+        self.session = session or create_session()
 
     def get_me_profile(self, access_token):
         url = urlparse.urljoin(self.base_url, self.urls.me_profile)
@@ -63,7 +65,7 @@ class ProfileApi(BaseProfileApi):
             'authorization': 'Bearer %s' % access_token
         }
 
-        response = requests.get(
+        response = self.session.get(
             url,
             headers=headers
         )
@@ -84,7 +86,7 @@ class ProfileApi(BaseProfileApi):
             'authorization': 'Bearer %s' % access_token
         }
 
-        response = requests.get(
+        response = self.session.get(
             url + '?XDEBUG_SESSION_START',
             headers=headers
         )
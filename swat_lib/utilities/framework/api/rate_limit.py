@@ -0,0 +1,177 @@
+"""
+Client-side rate limiting for the API wrappers (used by framework.api.base.with_rate_limit, which MetaApi applies to
+every API wrapper method).
+
+Fanning out bulk operations (e.g. provisioning through LicenseApi.post_products_products or IdApi.create_user) trips the
+services' own throttling. Endpoints can be put into groups, each of which has:
+
+- a token bucket, limiting the rate at which requests are started (with some allowance for bursts)
+- a semaphore, limiting the number of requests in flight at once
+
+Groups are configured from the 'rate_limits' section of the configuration, e.g.
+
+    rate_limits:
+      provisioning:
+        endpoints: ['LicenseApi.post_products_products', 'IdApi.create_user']
+        rate: 10            # Requests per second
+        burst: 20           # Requests that may be made at once after a quiet period
+        max_in_flight: 8
+
+Endpoints are named '<ApiClass>.<method_name>', and may be given as shell-style patterns (e.g. 'LicenseApi.*').
+Endpoints that aren't in any group aren't limited.
+
+If a 429 response is received anyway, the group's rate is halved, and then increases gradually again as requests
+succeed, so that bulk jobs settle at the highest rate the service will sustain.
+
+The limits are thread-safe, so they apply to thread pool callers as-is. The wrapper methods are blocking, so asyncio
+callers should run them in an executor (see call_in_executor), where the limits apply in the same way.
+"""
+import functools
+import threading
+import time
+from fnmatch import fnmatchcase
+
+
+class TokenBucket(object):
+
+    def __init__(self, rate, burst=None, min_rate=None):
+        """
+        :param rate: Number of requests per second
+        :param burst: Maximum number of tokens that can be saved up (defaults to one second's worth)
+        :param min_rate: Lowest rate that the bucket will back off to after a 429 (defaults to a tenth of the rate)
+        """
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.min_rate = float(min_rate or rate / 10.0)
+        self.burst = float(burst or max(rate, 1))
+        self.tokens = self.burst
+        self.updated_at = time.time()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes a token, going into 'debt' if there isn't one available yet.
+        :return: Number of seconds the caller should wait before making its request
+        """
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.tokens + (now - self.updated_at) * self.rate, self.burst)
+            self.updated_at = now
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def acquire(self):
+        """
+        Blocks until a request may be made.
+        :return: Number of seconds spent waiting
+        """
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def back_off(self):
+        """
+        Halve the rate (e.g. after a 429 response).
+        """
+        with self.lock:
+            self.rate = max(self.rate / 2, self.min_rate)
+
+    def recover(self):
+        """
+        Increase the rate a little (after a successful request), up to the configured rate.
+        """
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.rate + self.max_rate / 50, self.max_rate)
+
+
+class EndpointGroup(object):
+    """
+    Rate limit and concurrency limit shared by a group of endpoints.
+    """
+
+    def __init__(self, name, endpoints, rate=None, burst=None, max_in_flight=None):
+        """
+        :param name: Name of the group (for reporting)
+        :param endpoints: List of endpoint names/patterns (e.g. 'LicenseApi.post_products_products' or 'IdApi.*')
+        :param rate: Maximum number of requests per second (unlimited if None)
+        :param burst: Number of requests that can be made at once after a quiet period
+        :param max_in_flight: Maximum number of concurrent requests (unlimited if None)
+        """
+        self.name = name
+        self.endpoints = list(endpoints)
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.semaphore = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+
+    def matches(self, endpoint):
+        return any(fnmatchcase(endpoint, pattern) for pattern in self.endpoints)
+
+    def acquire(self):
+        """
+        Blocks until a request may be made.
+        :return: Number of seconds spent waiting
+        """
+        start = time.time()
+        if self.semaphore:
+            self.semaphore.acquire()
+        if self.bucket:
+            self.bucket.acquire()
+        return time.time() - start
+
+    def release(self, status_code=None):
+        """
+        :param status_code: Status code of the response, if one was received
+        """
+        if self.semaphore:
+            self.semaphore.release()
+        if self.bucket:
+            if status_code == 429:
+                self.bucket.back_off()
+            elif status_code is not None:
+                self.bucket.recover()
+
+
+class RateLimits(object):
+    """
+    Registry of endpoint groups, shared by all of the API wrappers in a session.
+    """
+
+    def __init__(self):
+        self.groups = []
+        self.cache = {}  # Endpoint name -> EndpointGroup (or None), so patterns are only matched once per endpoint
+        self.lock = threading.Lock()
+
+    def load(self, config):
+        """
+        :param config: dict of group name -> dict of EndpointGroup arguments (e.g. the 'rate_limits' configuration)
+        """
+        groups = [EndpointGroup(name, **dict(group_config)) for name, group_config in sorted((config or {}).items())]
+        with self.lock:
+            self.groups = groups
+            self.cache = {}
+
+    def get(self, endpoint):
+        """
+        :param endpoint: Endpoint name ('<ApiClass>.<method_name>')
+        :return: The first EndpointGroup that includes the endpoint, or None if it isn't limited
+        """
+        try:
+            return self.cache[endpoint]
+        except KeyError:
+            with self.lock:
+                group = next((g for g in self.groups if g.matches(endpoint)), None)
+                self.cache[endpoint] = group
+                return group
+
+
+def call_in_executor(loop, method, *args, **kwargs):
+    """
+    Runs a (blocking) API wrapper method in the event loop's default executor, so that asyncio callers can await it.
+    E.g. `user = await call_in_executor(loop, id_api.create_user, email, password, timestamp)`
+    """
+    return loop.run_in_executor(None, functools.partial(method, *args, **kwargs))
+
+
+# Shared by all API wrappers, so that limits apply across every caller in the session
+rate_limits = RateLimits()
@@ -0,0 +1,162 @@
+"""
+Retry policy for API calls (used by framework.api.base.retry_on_failure, which MetaApi applies to every API wrapper
+method).
+
+Transient errors from a stack (e.g. a 502/503 while a service restarts) shouldn't fail a test outright, but retrying
+everything blindly can make things worse: non-idempotent calls (e.g. creating a user) may be repeated, and a struggling
+service gets hit by a 'retry storm' from every test at once. So:
+
+- Only idempotent verbs are retried automatically; other methods must opt in (see retry_non_idempotent)
+- Delays grow exponentially, with 'full jitter' so that concurrent callers don't retry in lockstep
+- Retries are drawn from a budget that is shared by all wrappers, and which only refills as new calls are made
+- Retry-After headers are honoured
+"""
+import random
+import threading
+import time
+from email.utils import parsedate_tz, mktime_tz
+
+
+# Verbs that can be repeated without changing the result
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+# The request was rejected before being processed, so it's safe to retry whatever the verb
+ALWAYS_RETRYABLE_STATUSES = (429,)
+
+
+def retry_non_idempotent(func):
+    """
+    Decorator that opts a non-idempotent API wrapper method (e.g. a POST that is safe to repeat) in to automatic
+    retries.
+    """
+    func.retry_non_idempotent = True
+    return func
+
+
+class RetryBudget(object):
+    """
+    Token bucket that limits retries to a proportion of all calls. Every call deposits `ratio` tokens (up to
+    `max_tokens`), and every retry withdraws one. If the bucket is empty, the call fails without retrying.
+    """
+
+    def __init__(self, ratio=0.2, initial_tokens=10.0, max_tokens=20.0):
+        """
+        :param ratio: Number of retries 'earned' by each call (e.g. 0.2 allows one retry for every five calls)
+        :param initial_tokens: Tokens available at the start of the session
+        :param max_tokens: Maximum number of tokens that can be saved up
+        """
+        self.ratio = ratio
+        self.tokens = initial_tokens
+        self.max_tokens = max_tokens
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.tokens + self.ratio, self.max_tokens)
+
+    def withdraw(self):
+        """
+        :return: True if a retry may be made
+        """
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class RetryPolicy(object):
+    """
+    Decides whether (and after how long) a failed API call should be retried.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=10.0, retry_statuses=(429, 502, 503, 504),
+                 max_retry_after=30.0, budget=None):
+        """
+        :param max_attempts: Maximum number of attempts (including the first one)
+        :param base_delay: Delay (in seconds) before the first retry, doubled for each subsequent retry
+        :param max_delay: Maximum delay (in seconds) between attempts
+        :param retry_statuses: Response status codes that indicate a transient failure
+        :param max_retry_after: Don't retry if the server asks us to wait longer than this (in seconds)
+        :param budget: RetryBudget shared between callers (a new one is created if not given)
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = retry_statuses
+        self.max_retry_after = max_retry_after
+        self.budget = budget or RetryBudget()
+
+    @classmethod
+    def from_config(cls, config, budget=None):
+        """
+        :param config: dict of RetryPolicy arguments (e.g. the 'retry_policy' section of the configuration)
+        """
+        config = dict(config or {})
+        if 'retry_statuses' in config:
+            config['retry_statuses'] = tuple(config['retry_statuses'])
+        return cls(budget=budget, **config)
+
+    def backoff(self, attempt):
+        """
+        :param attempt: Number of attempts made so far
+        :return: Delay before the next attempt, with full jitter
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def get_retry_delay(self, attempt, method, response=None, opted_in=False):
+        """
+        :param attempt: Number of attempts made so far
+        :param method: HTTP verb of the failed request (or None if unknown)
+        :param response: Error response, or None if the request failed without a response (e.g. a connection error)
+        :param opted_in: Whether the wrapper method has opted in to retries regardless of verb
+        :return: Seconds to wait before retrying, or None if the call should not be retried
+        """
+        if attempt >= self.max_attempts:
+            return None
+
+        status_code = response.status_code if response is not None else None
+        if status_code is not None and status_code not in self.retry_statuses:
+            return None
+
+        safe_to_repeat = opted_in or (method or '').upper() in IDEMPOTENT_METHODS
+        if not safe_to_repeat and status_code not in ALWAYS_RETRYABLE_STATUSES:
+            return None
+
+        delay = self.backoff(attempt)
+
+        if response is not None:
+            retry_after = retry_after_seconds(response)
+            if retry_after is not None:
+                if retry_after > self.max_retry_after:
+                    return None
+                delay = max(delay, retry_after)
+
+        # Checked last, so that calls that wouldn't be retried anyway don't use up the budget
+        if not self.budget.withdraw():
+            return None
+
+        return delay
+
+
+def retry_after_seconds(response):
+    """
+    :param response: requests Response
+    :return: Delay (in seconds) requested by the response's Retry-After header, or None if there isn't one
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    date = parsedate_tz(value)
+    if date is None:
+        return None
+    return max(mktime_tz(date) - time.time(), 0.0)
+
+
+# Used by API wrappers that don't set their own retry_policy
+default_retry_policy = RetryPolicy()
@@ -0,0 +1,140 @@
+"""
+Incremental decoding of JSON list responses (e.g. {"items": [...]}).
+
+Listings for users with long histories can be very large. Rather than downloading the whole body and decoding it in one
+go (so that the body, its text, and every decoded item are all in memory at once), iter_json_items reads a streamed
+response a chunk at a time and yields each item of the list as soon as it has been decoded. Callers that only need the
+first few matching items can stop early, in which case the rest of the body is never downloaded.
+"""
+import codecs
+import json
+import re
+
+
+CHUNK_SIZE = 64 * 1024
+
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+
+def iter_json_items(response, key='items', chunk_size=CHUNK_SIZE, model=None):
+    """
+    Yields the items of the list stored under `key` in a JSON object response body.
+    :param response: requests Response, ideally requested with stream=True (if the body has already been downloaded,
+    it's decoded as normal)
+    :param key: Key of the list in the top-level JSON object
+    :param chunk_size: Number of bytes to read at a time
+    :param model: Optional ResponseModel class (from framework.models) to yield each item as
+    """
+    if getattr(response, '_content_consumed', True):
+        for item in response.json().get(key, []):
+            yield model(item) if model else item
+        return
+
+    try:
+        for item in JsonListReader(response.iter_content(chunk_size), key).items():
+            yield model(item) if model else item
+    finally:
+        # Releases the connection, whether or not the rest of the body has been read
+        response.close()
+
+
+class JsonListReader(object):
+    """
+    Minimal incremental parser for a top-level JSON object, which yields the items of one of its lists. Everything else
+    is decoded (and discarded) a whole value at a time with the standard library's raw_decode.
+    """
+
+    def __init__(self, chunks, key):
+        """
+        :param chunks: Iterable of byte strings (UTF-8)
+        :param key: Key of the list to yield the items of
+        """
+        self.chunks = iter(chunks)
+        self.key = key
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = u''
+        self.pos = 0
+        self.finished = False
+
+    def items(self):
+        self.expect(u'{')
+        if self.peek() == u'}':
+            return
+
+        while True:
+            name = self.value()
+            self.expect(u':')
+
+            if name == self.key:
+                self.expect(u'[')
+                if self.peek() == u']':
+                    return
+                while True:
+                    yield self.value()
+                    if self.next_char(u',]') == u']':
+                        return  # Nothing after the list is needed
+            else:
+                self.value()
+
+            if self.next_char(u',}') == u'}':
+                return
+
+    def read_more(self):
+        """
+        Adds the next chunk to the buffer (discarding the part that has already been parsed).
+        :return: False if there's nothing more to read
+        """
+        if self.finished:
+            return False
+
+        try:
+            text = self.text_decoder.decode(next(self.chunks))
+        except StopIteration:
+            text = self.text_decoder.decode(b'', True)
+            self.finished = True
+
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        :return: The next non-whitespace character (or an empty string at the end of the body)
+        """
+        while True:
+            self.pos = _whitespace.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or not self.read_more():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError('Expected %r at position %d of JSON list response' % (char, self.pos))
+        self.pos += 1
+
+    def next_char(self, allowed):
+        char = self.peek()
+        if not char or char not in allowed:
+            raise ValueError('Expected one of %r at position %d of JSON list response' % (allowed, self.pos))
+        self.pos += 1
+        return char
+
+    def value(self):
+        """
+        :return: The next complete JSON value, reading more of the body if necessary
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if self.read_more():
+                    continue
+                raise
+
+            # A number at the very end of the buffer may continue in the next chunk
+            if end == len(self.buffer) and self.read_more():
+                continue
+
+            self.pos = end
+            return value
@@ -0,0 +1,152 @@
+"""
+Simple caches: an in-memory LRU cache (with optional expiry), an on-disk cache that can be shared between runs, and a
+combination of the two.
+
+All are thread-safe, and are keyed on strings.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+_missing = object()
+
+
+class LruCache(object):
+
+    def __init__(self, max_entries=256, ttl=None):
+        """
+        :param max_entries: Maximum number of entries to keep. The least recently used entry is evicted to make room.
+        :param ttl: Default number of seconds that entries expire after (never, if None)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # Key -> (value, expiry time or None), least recently used first
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value, expires_at = self.entries.pop(key)
+            except KeyError:
+                return default
+
+            if expires_at is not None and time.time() >= expires_at:
+                return default
+
+            self.entries[key] = (value, expires_at)  # Re-inserting marks it as the most recently used
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        :param ttl: Number of seconds that the entry expires after (defaults to the cache's ttl)
+        """
+        ttl = self.ttl if ttl is None else ttl
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (value, time.time() + ttl if ttl is not None else None)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class DiskCache(object):
+    """
+    Pickles each entry to a file named after the SHA-256 of its key, so that entries are shared between runs (and
+    between processes).
+    """
+
+    def __init__(self, directory, ttl=None):
+        """
+        :param directory: Directory to keep the entries in (created if it doesn't exist)
+        :param ttl: Number of seconds after being written that entries expire (never, if None)
+        """
+        self.directory = directory
+        self.ttl = ttl
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, key):
+        if not isinstance(key, bytes):
+            key = key.encode('utf-8')
+        return os.path.join(self.directory, hashlib.sha256(key).hexdigest() + '.pickle')
+
+    def get(self, key, default=None):
+        path = self.path(key)
+        try:
+            if self.ttl is not None and time.time() - os.path.getmtime(path) >= self.ttl:
+                return default
+            with open(path, 'rb') as cache_file:
+                return pickle.load(cache_file)
+        except Exception:
+            return default  # Missing, or unreadable (e.g. written by an incompatible version): treat it as a miss
+
+    def set(self, key, value):
+        # Write to a temporary file first, so that other processes never read a partly-written entry
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as cache_file:
+                pickle.dump(value, cache_file, pickle.HIGHEST_PROTOCOL)
+            os.rename(temp_path, self.path(key))
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.pickle'):
+                os.remove(os.path.join(self.directory, name))
+
+
+class TieredCache(object):
+    """
+    LruCache in front of an optional DiskCache: entries are looked up in memory first, and entries found on disk are
+    kept in memory for next time.
+    """
+
+    def __init__(self, max_entries=256, directory=None):
+        """
+        :param max_entries: Maximum number of entries to keep in memory
+        :param directory: Optional directory to also keep entries in, so that they're shared between runs
+        """
+        self.memory = LruCache(max_entries)
+        self.disk = DiskCache(directory) if directory else None
+
+    def get(self, key, default=None):
+        value = self.memory.get(key, _missing)
+        if value is _missing and self.disk:
+            value = self.disk.get(key, _missing)
+            if value is not _missing:
+                self.memory.set(key, value)
+        return default if value is _missing else value
+
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk:
+            self.disk.set(key, value)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk:
+            self.disk.clear()
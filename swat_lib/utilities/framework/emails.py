@@ -2,16 +2,69 @@ import datetime
 import functools
 import imaplib
 import email
+import email.parser
 import time
 
 import pytest
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from dateutil import parser
+from dateutil.tz import tzutc
 from contextlib import contextmanager
 
+try:
+    from email import policy
+    from email.parser import BytesParser
+except ImportError:
+    BytesParser = None  # Python 2, where messages are parsed from (byte) strings by email.parser.Parser
+
+
+def parse_message(raw_message, headers_only=False):
+    """
+    Parses a raw RFC822 message. In Python 3, bytes are parsed directly (with the modern email API), rather than being
+    decoded to a string first; parts' bodies are only decoded when their content is read.
+    :param raw_message: bytes (or str) of the message, as fetched over IMAP
+    :param headers_only: Whether to only parse the headers (the body is left as an undecoded string)
+    :return: Message
+    """
+    if BytesParser is not None and isinstance(raw_message, bytes):
+        return BytesParser(policy=policy.default).parsebytes(raw_message, headersonly=headers_only)
+    return email.parser.Parser().parsestr(raw_message, headersonly=headers_only)
+
+
+EMAIL_CLOCK_SKEW = datetime.timedelta(seconds=5)  # Allowed difference between the clocks of email senders and ours
+
+
+def as_utc(date):
+    """
+    :return: The datetime in UTC (naive datetimes are assumed to be in UTC already)
+    """
+    return date.replace(tzinfo=tzutc()) if date.tzinfo is None else date.astimezone(tzutc())
+
+
+def get_part_text(part):
+    """
+    :return: The body of a (non-multipart) message part as text, with any transfer encoding (quoted-printable, base64)
+    and charset decoded
+    """
+    if hasattr(part, 'get_content'):  # EmailMessage (from the modern email API)
+        try:
+            return part.get_content()
+        except LookupError:
+            pass  # Unknown charset: fall back to decoding it leniently below
+
+    payload = part.get_payload(decode=True) or b''
+    try:
+        return payload.decode(part.get_content_charset() or 'us-ascii', 'replace')
+    except LookupError:
+        return payload.decode('utf-8', 'replace')
+
 
 class Email(object):
     """
     Model (for convenience) of an email, into which data can be loaded from a Message object.
+
+    The body isn't decoded until content (or html) is first read, so emails that are only matched on their headers
+    never pay for it.
     """
 
     def __init__(self, uid):
@@ -20,43 +73,110 @@ class Email(object):
         """
         self.recipient = ''
         self.message_id = ''
-        self.content = ''
         self.date = None
         self.subject = ''
         self.sender = ''
         self.reply_to = ''
         self.uid = uid
+        self.message = None
+        self.headers_only = False
+        self._content = None
+        self._html = None
 
-    def load(self, message):
+    def load(self, message, headers_only=False):
         """
         Load data returned via a POP3/IMAP connection into the model
         :param message: Message to parse into a slightly more minimal/usable form
+        :param headers_only: Whether the message only has headers (in which case content and html are empty)
         """
         self.recipient = message['Delivered-To']
         self.date = parser.parse(message['Date'])
         self.message_id = message['Message-Id']
-        self.content = self.get_message_content(message)
         self.subject = message['Subject']
         self.sender = message['From']
         self.reply_to = message['Reply-To']
+        self.message = message
+        self.headers_only = headers_only
+        self._content = None
+        self._html = None
 
         return self
 
+    @property
+    def content(self):
+        """
+        :return: Text of the text/plain parts of the email
+        """
+        if self._content is None:
+            self._content = self.get_message_content(self.message) if self.has_body else ''
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        self._content = value
+
+    @property
+    def html(self):
+        """
+        :return: HTML of the text/html parts of the email (e.g. for an emails.base.BaseEmail)
+        """
+        if self._html is None:
+            self._html = self.get_message_content(self.message, 'text/html') if self.has_body else ''
+        return self._html
+
+    @property
+    def has_body(self):
+        return self.message is not None and not self.headers_only
+
     @staticmethod
-    def get_message_content(message):
+    def get_message_content(message, content_type='text/plain'):
+        """
+        :return: The decoded text of the message's parts of the given content type (attachments aren't included). The
+        body of a single-part message is its text/plain content, whatever its type.
+        """
+        if not message.is_multipart():
+            if content_type == 'text/plain' or message.get_content_type() == content_type:
+                return get_part_text(message)
+            return ''
 
-        if message.is_multipart():
-            content_parts = []
+        return ''.join(
+            get_part_text(part) for part in message.walk()
+            if part.get_content_type() == content_type and
+            not str(part.get('Content-Disposition', '')).lower().startswith('attachment')
+        )
 
-            for part in message.walk():
-                if part.get_content_type() == 'text/plain':
-                    content_parts.append(part.get_payload())
 
-            content = ''.join(content_parts)
-        else:
-            content = message.get_payload()
+IMAP_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
 
-        return content
+def imap_date(value):
+    """
+    :param value: date or datetime (or an already formatted string)
+    :return: The date in the format used by IMAP searches (e.g. 19-Oct-2026), which doesn't depend on the locale
+    """
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return '%d-%s-%d' % (value.day, IMAP_MONTHS[value.month - 1], value.year)
+    return value
+
+
+def imap_string(value):
+    """
+    :return: The value as a quoted IMAP string
+    """
+    return '"%s"' % ('%s' % value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def uid_set(value):
+    """
+    :param value: A UID, a (first, last) range (last may be None, for no upper bound), or a list of UIDs
+    :return: IMAP sequence set of the UIDs, e.g. '5', '5:*' or '5,7,9'
+    """
+    if isinstance(value, tuple):
+        first, last = value
+        return '%d:%s' % (first, '*' if last is None else int(last))
+    if isinstance(value, (list, set, frozenset)):
+        return ','.join(str(int(uid)) for uid in sorted(value))
+    return str(value)
 
 
 class EmailQuery(object):
@@ -65,16 +185,52 @@ class EmailQuery(object):
     criteria to the ImapHelper as dictionaries of attributes (e.g. {'subject': 'Change your Serato email address'})
 
     These criteria are in fact part of the IMAP; see here: https://gist.github.com/martinrusev/6121028
+
+    All criteria in a dict must match. They can be composed with 'not' (a dict of criteria that must not all match)
+    and 'or' (a list of dicts, at least one of which must match), e.g.
+
+        {'subject': 'Reset your password', 'since': datetime.date.today(), 'not': {'from': 'noreply@example.com'},
+         'or': [{'to': 'a@example.com'}, {'to': 'b@example.com'}]}
+
+    so that searches are narrowed down on the server, rather than by filtering the results afterwards.
     """
 
     criteria = {
-        'subject': 'SUBJECT "%s"',
-        'from': 'FROM "%s"',
-        'to': 'TO "%s"'
+        'subject': 'SUBJECT %s',
+        'from': 'FROM %s',
+        'to': 'TO %s',
+        'body': 'BODY %s',
+        'since': 'SINCE %s',  # Dates (see imap_date) on which, or after which, the email was received
+        'before': 'BEFORE %s',
+        'sent_since': 'SENTSINCE %s',  # Dates from the email's Date header
+        'sent_before': 'SENTBEFORE %s',
+        'message_id': 'HEADER Message-Id %s',
+        'uid': 'UID %s',  # See uid_set
+        'gmail_raw': 'X-GM-RAW %s',  # Gmail search syntax, e.g. 'newer_than:1h' (only if the server supports it)
+    }
+
+    formatters = {
+        'subject': imap_string,
+        'from': imap_string,
+        'to': imap_string,
+        'body': imap_string,
+        'since': imap_date,
+        'before': imap_date,
+        'sent_since': imap_date,
+        'sent_before': imap_date,
+        'message_id': imap_string,
+        'uid': uid_set,
+        'gmail_raw': imap_string,
     }
 
-    def __init__(self):
+    GMAIL_CAPABILITY = 'X-GM-EXT-1'
+
+    def __init__(self, capabilities=()):
+        """
+        :param capabilities: Capabilities of the IMAP server (see IMAP4.capabilities), to check extensions against
+        """
         self.query_parts = []
+        self.capabilities = capabilities
 
     def construct(self):
         return '(%s)' % ' '.join(self.query_parts)
@@ -85,12 +241,30 @@ class EmailQuery(object):
         Note: will raise errors if the dict includes invalid keys
         :param attribute_dict: dict of attributes such as 'subject', 'from', etc.
         """
-        query = EmailQuery()
+        for attribute, val in sorted(attribute_dict.items()):
+            self.query_parts.append(self.criterion(attribute, val))
+
+        return self
 
-        for attribute, val in attribute_dict.items():
-            self.query_parts.append(EmailQuery.criteria[attribute] % val)
+    def criterion(self, attribute, val):
+        if attribute == 'not':
+            return 'NOT %s' % self.sub_query(val)
+        if attribute == 'or':
+            if len(val) < 2:
+                raise ValueError("'or' needs at least two sets of criteria")
+            # OR only takes two keys, so more alternatives are nested: OR a OR b c
+            query = self.sub_query(val[-1])
+            for alternative in reversed(val[:-1]):
+                query = 'OR %s %s' % (self.sub_query(alternative), query)
+            return query
+        if attribute == 'gmail_raw' and self.GMAIL_CAPABILITY not in self.capabilities:
+            raise ImapException('The IMAP server does not support X-GM-RAW searches (no %s capability)' %
+                                self.GMAIL_CAPABILITY)
 
-        return query
+        return EmailQuery.criteria[attribute] % self.formatters[attribute](val)
+
+    def sub_query(self, attribute_dict):
+        return EmailQuery(self.capabilities).load_from_dict(attribute_dict).construct()
 
 
 def record_uid(func=None):
@@ -128,6 +302,7 @@ class ImapHelper(object):
         self.retries = retries
         self.email_search_errors = email_search_errors
         self.log = logger
+        self.executor = None  # Runs the searches of expect_email in the background (created when first needed)
 
     @contextmanager
     def connection(self):
@@ -163,6 +338,72 @@ class ImapHelper(object):
         self.validate_search_results(emails, criteria, email_search_errors=email_search_errors)
         return ImapHelper.get_latest(emails)
 
+    def expect_email(self, criteria, watcher=None, email_search_errors=False):
+        """
+        Starts looking for the latest email matching the criteria in the background, and returns at once, so that the
+        test can carry on (e.g. with UI steps) while the email is delivered. Only emails that arrive after this call
+        match, so it should be made before triggering the email:
+
+            expected = email_helper.expect_email({'to': test_specific_email, 'subject': 'Reset your password'})
+            id_api.send_reset_password(test_specific_email)
+            ...
+            email = expected.join()
+
+        :param criteria: dict of search criteria (see EmailQuery)
+        :param watcher: Optional InboxWatcher (see the inbox_watcher fixture) to wait on, rather than searching the
+        inbox on a connection of our own. Criteria that the watcher can't match fall back to searching.
+        :param email_search_errors: As for search_for_latest
+        :return: ExpectedEmail
+        """
+        if watcher is not None:
+            try:
+                future = watcher.watch(criteria, include_seen=False)
+            except ValueError:
+                pass  # Criteria the watcher can't match (e.g. dates): search instead
+            else:
+                # Wait as long as searching would have
+                return ExpectedEmail(self, criteria, future, timeout=(self.retries + 1) * 10,
+                                     email_search_errors=email_search_errors)
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=4)
+        future = self.executor.submit(self.find_latest, criteria, datetime.datetime.now(tzutc()))
+        return ExpectedEmail(self, criteria, future, email_search_errors=email_search_errors)
+
+    def find_latest(self, criteria, sent_after=None):
+        """
+        Searches for the latest email matching the criteria on a new connection (only fetching the headers of the
+        emails that aren't the latest), polling the server as request_with_retry does.
+        :param sent_after: Optional (timezone-aware) datetime: older emails are ignored. Dates in emails only have a
+        resolution of seconds, and the sender's clock may differ slightly from ours, so EMAIL_CLOCK_SKEW is allowed.
+        :return: The latest matching Email, or None if there isn't one
+        """
+        if sent_after is not None and 'sent_since' not in criteria:
+            # Narrows the search on the server (SENTSINCE only compares dates, so allow for time zones)
+            criteria = dict(criteria, sent_since=(sent_after - datetime.timedelta(days=1)).date())
+
+        with self.connection() as conn:
+            for attempt in range(self.retries + 1):
+                emails = self.search(conn, criteria, headers_only=True, retry=False)
+                if sent_after is not None:
+                    emails = [e for e in emails if e.date and as_utc(e.date) >= sent_after - EMAIL_CLOCK_SKEW]
+                latest = ImapHelper.get_latest(emails)
+                if latest is not None:
+                    email = self.get_email_by_id(conn, latest.uid)
+                    self.uids.append(email.uid)
+                    return email
+                if attempt < self.retries:
+                    time.sleep(10)  # Same interval as request_with_retry
+            return None
+
+    def close(self):
+        """
+        Waits for any searches started by expect_email to finish.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
     def search_for_latest_n_emails(self, conn, criteria, messages_num, email_search_errors=False):
         emails = self.search(conn, criteria)
         self.validate_search_results(emails, criteria, expected_count=messages_num,
@@ -188,48 +429,57 @@ class ImapHelper(object):
                 # Exit the test (to prevent related failures)
                 pytest.skip('Emails not found.')
 
-    def search(self, conn, criteria):
+    def search(self, conn, criteria, headers_only=False, retry=True):
         """
         Returns all emails matching a dictionary of attributes (e.g. 'from', 'subject')
         :param conn: IMAP4/IMAP4_SSL connection
         :param criteria: dict of search criteria to match emails against
+        :param headers_only: Whether to only fetch the emails' headers (see get_email_by_id)
+        :param retry: Whether to poll the server until something matches (see request_with_retry)
         :return: A list of Email objects, representing the emails that matched the given attributes
         """
-        query = ImapHelper.construct_search_query(criteria)
+        query = ImapHelper.construct_search_query(criteria, getattr(conn, 'capabilities', ()))
 
         # Search and return UIDs (rather than the volatile sequential IDs returned by search())
-        data = self.request_with_retry(conn, 'search', None, query)
+        if retry:
+            data = self.request_with_retry(conn, 'search', None, query)
+        else:
+            status, data = conn.uid('search', None, query)
+            self.validate_results(status, data)
 
         # If all goes well, we'll receive a string of matching email ids (which we'll convert to ints)
         ids = map(int, data[0].split())
 
         # Retrieve each matching result and convert it into an Email object
-        return [self.get_email_by_id(conn, email_id) for email_id in ids]
+        return [self.get_email_by_id(conn, email_id, headers_only) for email_id in ids]
 
     @staticmethod
-    def construct_search_query(criteria):
+    def construct_search_query(criteria, capabilities=()):
         """
         Construct an IMAP search query from a dictionary of search criteria
-        :param criteria: dict of Email attributes to use as search criteria
+        :param criteria: dict of Email attributes to use as search criteria (see EmailQuery)
+        :param capabilities: Capabilities of the IMAP server (needed for Gmail's X-GM-RAW)
         :return: string query that can be used in IMAP4::search()
         """
-        query = EmailQuery()
+        query = EmailQuery(capabilities)
         query.load_from_dict(criteria)
         return query.construct()
 
-    def get_email_by_id(self, conn, email_uid):
+    def get_email_by_id(self, conn, email_uid, headers_only=False):
         """
         Requests the email with the given ID from the IMAP server and converts it to an Email object
         :param conn: IMAP4/IMAP4_SSL connection
         :param email_uid: int email unique ID
+        :param headers_only: Whether to only fetch the headers (e.g. to match emails by date or subject), in which case
+        the email's content is empty. This doesn't mark the email as read.
         :return: Email object for the email matching the given ID
         """
-        data = self.request_with_retry(conn, 'fetch', email_uid, '(RFC822)')
+        data = self.request_with_retry(conn, 'fetch', email_uid, '(BODY.PEEK[HEADER])' if headers_only else '(RFC822)')
 
-        # Parse the string representation of the email to a Message, and then to an Email object
+        # Parse the raw email to a Message, and then to an Email object
         metadata, raw_message = data[0]
-        message = email.parser.Parser().parsestr(raw_message)
-        return Email(email_uid).load(message)
+        message = parse_message(raw_message, headers_only)
+        return Email(email_uid).load(message, headers_only)
 
     @staticmethod
     def validate_results(status, data):
@@ -280,6 +530,43 @@ class ImapHelper(object):
         return data
 
 
+class ExpectedEmail(object):
+    """
+    Handle of an email being looked for in the background (see ImapHelper.expect_email).
+    """
+
+    def __init__(self, helper, criteria, future, timeout=None, email_search_errors=False):
+        """
+        :param timeout: Default number of seconds to wait in join (forever, if None)
+        """
+        self.helper = helper
+        self.criteria = criteria
+        self.future = future
+        self.timeout = timeout
+        self.email_search_errors = email_search_errors
+
+    def done(self):
+        return self.future.done()
+
+    def cancel(self):
+        return self.future.cancel()
+
+    def join(self, timeout=None):
+        """
+        Waits for the email. If it isn't found, the test fails or is skipped, as with ImapHelper.search_for_latest.
+        :param timeout: Number of seconds to wait (defaults to the handle's timeout)
+        :return: Email
+        """
+        try:
+            email = self.future.result(self.timeout if timeout is None else timeout)
+        except FutureTimeoutError:
+            email = None
+
+        if email is None:
+            self.helper.validate_search_results([], self.criteria, email_search_errors=self.email_search_errors)
+        return email
+
+
 class ImapException(Exception):
 
     def __init__(self, message):
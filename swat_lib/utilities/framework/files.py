@@ -1,11 +1,34 @@
 """
 Helper functions for file manipulation
 """
+import hashlib
+import io
+import multiprocessing
 import os
 import subprocess
 import tempfile
 import uuid
 from contextlib import contextmanager
+from io import BytesIO
+
+from framework.cache import TieredCache
+
+try:
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+    from pdfminer.pdfpage import PDFPage
+except ImportError:
+    PDFPage = None  # Text is extracted by a pdf2txt subprocess instead (if it's installed in the virtualenv)
+
+
+SPOOL_MAX_SIZE = 1024 * 1024  # Default number of bytes that spooled temp files keep in memory before using a file
+
+
+def _temp_path(prefix=''):
+    identifier = str(uuid.uuid4())
+    name = '%s_%s' % (prefix, identifier) if prefix else identifier
+    return os.path.join(tempfile.gettempdir(), name)
 
 
 @contextmanager
@@ -14,9 +37,7 @@ def temp_open(mode='wb', prefix=''):
     Context manager for creating and opening a file temporarily, and then deleting it afterwards.
     Python does have similar utilities (see tempfile), but sometimes this flexibility is useful.
     """
-    identifier = str(uuid.uuid4())
-    name = '%s_%s' % (prefix, identifier) if prefix else identifier
-    path = os.path.join(tempfile.gettempdir(), name)
+    path = _temp_path(prefix)
     f = open(path, mode)
     try:
         yield f
@@ -25,17 +46,239 @@ def temp_open(mode='wb', prefix=''):
         os.unlink(path)
 
 
+class SpooledTempFile(object):
+    """
+    Binary temporary file that's kept in memory until it grows beyond max_size, and only then written to disk. Unlike
+    tempfile.SpooledTemporaryFile, the file on disk has a name, so it can be handed to things that need a path (e.g.
+    subprocesses): accessing .path writes the file out if it hasn't been already.
+
+    Writes accept anything that supports the buffer protocol (bytes, bytearray, memoryview, ...), and are made through
+    a memoryview, so large payloads (e.g. invoices) aren't copied on the way to disk.
+
+    Other file methods (read, seek, tell, ...) are passed through to the underlying BytesIO or file.
+    """
+
+    def __init__(self, max_size=SPOOL_MAX_SIZE, prefix=''):
+        """
+        :param max_size: Number of bytes to keep in memory before writing to disk
+        :param prefix: Prefix of the file name, if it's written to disk
+        """
+        self.max_size = max_size
+        self.prefix = prefix
+        self.file = BytesIO()
+        self._path = None  # Set once written to disk
+
+    @property
+    def rolled_over(self):
+        """
+        :return: Whether the contents have been written to disk
+        """
+        return self._path is not None
+
+    @property
+    def path(self):
+        """
+        :return: Path of the file on disk (with everything written so far flushed to it)
+        """
+        self.rollover()
+        self.file.flush()
+        return self._path
+
+    def write(self, data):
+        view = memoryview(data)
+        size = getattr(view, 'nbytes', None)  # Python 2's memoryview has no nbytes
+        if size is None:
+            size = len(view) * view.itemsize
+        if not self.rolled_over and self.file.tell() + size > self.max_size:
+            self.rollover()
+        return self.file.write(view)
+
+    def rollover(self):
+        """
+        Moves the contents from memory to a file on disk (if they aren't there already).
+        """
+        if self.rolled_over:
+            return
+        path = _temp_path(self.prefix)
+        f = io.open(path, 'w+b')
+        try:
+            position = self.file.tell()
+            f.write(self.file.getvalue())
+            f.seek(position)
+        except Exception:
+            f.close()
+            os.unlink(path)
+            raise
+        self.file, self._path = f, path
+
+    def close(self):
+        """
+        Closes the file, but doesn't delete it from disk (so that, e.g., a subprocess can open it on Windows).
+        """
+        self.file.close()
+
+    def delete(self):
+        self.file.close()
+        if self.rolled_over and os.path.exists(self._path):
+            os.unlink(self._path)
+
+    def __getattr__(self, name):
+        # Only called for attributes that aren't found normally. A missing file (e.g. while unpickling or copying,
+        # before __init__ has run) raises an AttributeError rather than recursing, and special methods (e.g.
+        # __getstate__) aren't taken from the file.
+        if name.startswith('__') or 'file' not in self.__dict__:
+            raise AttributeError(name)
+        return getattr(self.file, name)
+
+
+@contextmanager
+def spooled_temp_open(max_size=SPOOL_MAX_SIZE, prefix=''):
+    """
+    Context manager for a SpooledTempFile, which is deleted afterwards. Small payloads never touch the disk, unless a
+    path is asked for.
+    """
+    f = SpooledTempFile(max_size, prefix)
+    try:
+        yield f
+    finally:
+        f.delete()
+
+
 class PdfTextExtractionException(Exception):
     pass
 
 
-def pdf_bytestring_to_text(byte_string):
+def pdf_bytestring_to_text(byte_string, in_process=True):
+    """
+    Extracts text from a PDF byte string, with the same output (UTF-8 bytes) as pdfminer's pdf2txt.py.
+
+    If pdfminer can be imported, the text is extracted in-process, straight from memory. Otherwise (or if in_process is
+    False), the bytes are written to a file and a pdf2txt subprocess is opened (see
+    pdf_bytestring_to_text_subprocess).
+    """
+    if in_process and PDFPage is not None:
+        return b''.join(iter_pdf_pages(byte_string))
+    return pdf_bytestring_to_text_subprocess(byte_string)
+
+
+def pdf_bytestrings_to_text(byte_strings, processes=None, cache=None):
+    """
+    Extracts text from many PDF byte strings (e.g. invoices) in parallel, on a pool of processes.
+
+    Results are memoized by the SHA-256 of the bytes (in pdf_text_cache, unless another cache is given), so identical
+    PDFs are only parsed once, even if they appear several times in the list.
+    :param byte_strings: List of PDF byte strings
+    :param processes: Number of processes to use (defaults to the number of cores)
+    :param cache: TieredCache to memoize results in (e.g. with a directory, to share results between runs)
+    :return: List of the text of each PDF (see pdf_bytestring_to_text), in the same order as byte_strings
+    """
+    cache = pdf_text_cache if cache is None else cache
+    digests = [hashlib.sha256(byte_string).hexdigest() for byte_string in byte_strings]
+
+    texts = {}
+    to_extract = {}  # Digest -> byte string, for PDFs that haven't been parsed before
+    for digest, byte_string in zip(digests, byte_strings):
+        if digest not in texts and digest not in to_extract:
+            text = cache.get(digest)
+            if text is None:
+                to_extract[digest] = byte_string
+            else:
+                texts[digest] = text
+
+    if to_extract:
+        pending = list(to_extract.items())
+        processes = min(processes or multiprocessing.cpu_count(), len(pending))
+
+        if processes > 1:
+            pool = multiprocessing.Pool(processes)
+            try:
+                extracted = pool.map(pdf_bytestring_to_text, [byte_string for _, byte_string in pending], chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            extracted = [pdf_bytestring_to_text(byte_string) for _, byte_string in pending]
+
+        for (digest, _), text in zip(pending, extracted):
+            texts[digest] = text
+            cache.set(digest, text)
+
+    return [texts[digest] for digest in digests]
+
+
+def iter_pdf_pages(byte_string, page_numbers=None):
+    """
+    Extracts the text of each page of a PDF byte string in turn, in-process. Pages are only parsed and laid out as
+    they're iterated over, so stopping early skips the rest of the document.
+    :param byte_string: PDF file contents
+    :param page_numbers: Optional collection of (zero-based) numbers of the pages to extract
+    :return: Generator of the text of each page (UTF-8 bytes, each ending in a form feed, as written by pdf2txt)
+    """
+    if PDFPage is None:
+        raise PdfTextExtractionException('pdfminer is not installed')
+
+    manager = PDFResourceManager()  # Shared between pages, so that fonts are only loaded once
+    laparams = LAParams()
+
+    try:
+        for page in PDFPage.get_pages(BytesIO(byte_string), pagenos=page_numbers):
+            output = BytesIO()
+            device = TextConverter(manager, output, codec='utf-8', laparams=laparams)
+            try:
+                PDFPageInterpreter(manager, device).process_page(page)
+            finally:
+                device.close()
+            yield output.getvalue()
+    except Exception as e:
+        raise PdfTextExtractionException('Could not extract text from PDF: %s' % e)
+
+
+class PdfPages(object):
+    """
+    The text of each page of a PDF (as unicode), extracted lazily: a page is only parsed when it (or a later page) is
+    first accessed, e.g. PdfPages(invoice)[0] only lays out the first page.
+    """
+
+    def __init__(self, byte_string):
+        self.byte_string = byte_string
+        self.pages = iter_pdf_pages(byte_string)
+        self.texts = []  # Text of the pages extracted so far
+
+    def __getitem__(self, index):
+        if index < 0:
+            raise IndexError('PdfPages does not support negative indices')
+        while len(self.texts) <= index:
+            try:
+                self.texts.append(next(self.pages).decode('utf-8'))
+            except StopIteration:
+                raise IndexError('PDF has %d pages' % len(self.texts))
+        return self.texts[index]
+
+    def __iter__(self):
+        index = 0
+        while True:
+            try:
+                yield self[index]
+            except IndexError:
+                return
+            index += 1
+
+    @property
+    def extracted(self):
+        """
+        :return: Number of pages extracted so far
+        """
+        return len(self.texts)
+
+
+def pdf_bytestring_to_text_subprocess(byte_string):
     """
     Extracts text from a PDF byte string by first writing the bytes to a file and then opening a pdfminer subprocess.
     """
-    with temp_open(prefix='invoice') as f:
+    with spooled_temp_open(max_size=0, prefix='invoice') as f:
         # Create a PDF, then close it so that pdfminer can use it
         f.write(byte_string)
+        path = f.path
         f.close()
 
         # pdf2txt is the command-line utility that comes bundled with pdfminer
@@ -46,7 +289,7 @@ def pdf_bytestring_to_text(byte_string):
             pdf2txt = os.path.join(os.environ['VIRTUAL_ENV'], 'Scripts', 'pdf2txt.py')
 
         # Issues in Windows mean we can't run py2txt.py as an executable, and must instead open a Python subprocess
-        args = ['python', pdf2txt, f.name]
+        args = ['python', pdf2txt, path]
         pipe = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
         # From textract: "pipe.wait() ends up hanging on large files... pipe.communicate appears to avoid this issue"
@@ -59,3 +302,8 @@ def pdf_bytestring_to_text(byte_string):
             )
 
         return stdout
+
+
+# Text extracted by pdf_bytestrings_to_text, keyed by the SHA-256 of the PDF bytes (in memory only: pass a TieredCache
+# with a directory to pdf_bytestrings_to_text to keep results between runs)
+pdf_text_cache = TieredCache(max_entries=512)
@@ -11,9 +11,14 @@ import pytest
 
 from framework import base
 from framework import helpers
+from framework.api.cache import ResponseCache
+from framework.api.circuit_breaker import circuit_breakers
 from framework.api.ecom import EcomAPI
 from framework.api.id import IdApi
+from framework.api.rate_limit import rate_limits
 from framework.base import set_environment_from_file
+from framework.generators import DataGenerator
+from framework.inbox_watcher import InboxWatcher
 
 from framework.emails import ImapHelper
 from datetime import datetime, timedelta
@@ -66,6 +71,13 @@ def pytest_addoption(parser):
                                                                                  'slow server processes. If false, '
                                                                                  'errors will be downgraded to '
                                                                                  'warnings.')
+    parser.addoption('--async-screenshots', action='store_true', default=False,
+                     help='Write screenshots of failures in the background, so that test teardown doesn\'t wait for '
+                          'them to be encoded and saved. They are all written by the end of the session.')
+    parser.addoption('--screenshot-format', action='store', default='png', choices=('png', 'webp'),
+                     help='Image format of screenshots of failures (webp is much smaller; needs Pillow).')
+    parser.addoption('--screenshot-scale', action='store', default=1.0,
+                     help='Factor to resize screenshots of failures by, e.g. 0.5 (needs Pillow).')
 
 
 def pytest_generate_tests(metafunc):
@@ -169,6 +181,17 @@ def managed_data():
         pass  # record.destroy()
 
 
+@pytest.fixture(scope='session')
+def data_generator(log):
+    """
+    Generator of unique users, addresses and credit cards (see framework.generators). The seed is logged, so that a
+    run's data can be reproduced with DataGenerator(seed=...).
+    """
+    generator = DataGenerator()
+    log.info('Test data generator seed: %d' % generator.seed)
+    return generator
+
+
 @pytest.fixture(scope='session')
 def ecom_api(global_config):
     return EcomAPI(global_config.ecom_home, global_config.urls.ecom.api)
@@ -272,8 +295,22 @@ def email_helper(global_config, email_retries, email_search_errors, log):
     Yields an ImapHelper (for interacting with a user's inbox) initialised with the default user's credentials.
     """
     retries = int(email_retries)
-    yield ImapHelper(global_config.users.default.email, global_config.users.default.password, retries=retries,
-                     email_search_errors=email_search_errors, logger=log)
+    helper = ImapHelper(global_config.users.default.email, global_config.users.default.password, retries=retries,
+                        email_search_errors=email_search_errors, logger=log)
+    yield helper
+    helper.close()
+
+
+@pytest.fixture(scope='session')
+def inbox_watcher(global_config, log):
+    """
+    Yields an InboxWatcher of the default user's inbox (which test-specific addresses are delivered to), shared by the
+    whole session, so that tests waiting for emails don't each poll the inbox. See framework.inbox_watcher.
+    """
+    watcher = InboxWatcher(global_config.users.default.email, global_config.users.default.password, logger=log)
+    watcher.start()
+    yield watcher
+    watcher.stop()
 
 
 @pytest.fixture(scope='session')
@@ -409,6 +446,35 @@ def add_session_logger(request, log):
     request.session.log = log
 
 
+@pytest.fixture(scope='session', autouse=True)
+def report_circuit_breakers(log, slack_recipients):
+    """
+    Reports API circuit breaker state changes (e.g. a service going down) to the session logger and Slack recipients,
+    once per change rather than once per test.
+    """
+    circuit_breakers.logger = log
+    circuit_breakers.slack_recipients = slack_recipients
+
+
+@pytest.fixture(scope='session', autouse=True)
+def configure_rate_limits(global_config):
+    """
+    Applies the rate limits / concurrency limits in the 'rate_limits' section of the configuration (if any) to the API
+    wrappers.
+    """
+    rate_limits.load(dict(global_config).get('rate_limits'))
+
+
+@pytest.fixture(scope='session')
+def response_cache(global_config):
+    """
+    ResponseCache for reference data (e.g. product types), configured by the 'response_cache' section of the
+    configuration (ttl, max_entries and, to share responses between runs, directory). None if it isn't configured. Pass
+    it to an API wrapper to use it, e.g. `LicenseApi(..., response_cache=response_cache)`.
+    """
+    return ResponseCache.from_config(dict(global_config).get('response_cache'))
+
+
 @pytest.fixture(scope='session')
 def output_url(global_config, name, output):
     """
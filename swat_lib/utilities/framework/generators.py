@@ -0,0 +1,255 @@
+# coding: utf-8
+"""
+Seeded generator of unique, valid test data (users, addresses and credit cards) for provisioning and load tests, where
+the single defaults of framework.models (e.g. '4 Test Drive' and '4111111111111111') aren't enough.
+
+Records are unique within a generator (emails and card numbers are derived from a per-record index, which keeps
+counting across calls), and the same seed always produces the same records, given the same sequence of calls. They're
+available either as streams of models, e.g.
+
+    generator = DataGenerator(seed=42)
+    for user, address, card in itertools.islice(zip(generator.users(), generator.addresses('US'),
+                                                    generator.credit_cards()), 1000):
+        ...
+
+or as columns (dicts of field name -> list, or numpy array where numpy is installed), which are much quicker to
+produce in bulk than millions of model objects:
+
+    columns = generator.credit_card_columns(10 ** 6)
+
+With numpy, credit card columns draw their expiration dates and CVVs from a random stream of their own (see
+credit_card_columns), so only their card numbers are the same as those produced without numpy.
+"""
+import itertools
+import random
+from datetime import datetime
+
+from framework.models import User, Address, CreditCard
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+FIRST_NAMES = (
+    'Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie', 'Avery', 'Quinn', 'Charlie', 'Rowan',
+    'Hayden', 'Emerson', 'Finley', 'Harper', 'Kai', 'Reese', 'Sage', 'Skyler'
+)
+
+LAST_NAMES = (
+    'Smith', 'Brown', 'Wilson', 'Taylor', 'Walker', 'Harris', 'Martin', 'Clarke', 'Young', 'King', 'Wright', 'Scott',
+    'Green', 'Baker', 'Adams', 'Hill', 'Turner', 'Ngata', 'Singh', 'Chen'
+)
+
+# Locale -> street names, cities, street address format, second address line formats and post code format ('9' is a
+# random digit, 'A' a random letter)
+LOCALES = {
+    'NZ': (('Queen Street', 'Ponsonby Road', 'Cuba Street', 'Colombo Street', 'George Street'),
+           ('Auckland', 'Wellington', 'Christchurch', 'Dunedin', 'Hamilton'),
+           '{number} {street}', ('Unit {number}', 'Flat {number}', 'Level {number}'), '9999'),
+    'AU': (('George Street', 'Collins Street', 'Queen Street', 'Hay Street', 'Rundle Mall'),
+           ('Sydney', 'Melbourne', 'Brisbane', 'Perth', 'Adelaide'),
+           '{number} {street}', ('Unit {number}', 'Suite {number}', 'Level {number}'), '9999'),
+    'US': (('Main Street', 'Oak Avenue', 'Maple Drive', 'Park Place', 'Sunset Boulevard'),
+           ('Springfield', 'Portland', 'Austin', 'Denver', 'Madison'),
+           '{number} {street}', ('Apt {number}', 'Suite {number}', 'Unit {number}'), '99999'),
+    'GB': (('High Street', 'Station Road', 'Church Lane', 'Victoria Road', 'Mill Lane'),
+           ('London', 'Manchester', 'Bristol', 'Leeds', 'Glasgow'),
+           '{number} {street}', ('Flat {number}', 'Apartment {number}', 'Unit {number}'), 'AA9 9AA'),
+    'DE': ((u'Hauptstraße', u'Schulstraße', u'Gartenweg', u'Bahnhofstraße', u'Dorfstraße'),
+           (u'Berlin', u'Hamburg', u'München', u'Köln', u'Frankfurt'),
+           u'{street} {number}', (u'Wohnung {number}', u'{number}. OG', u'Hinterhaus {number}'), '99999'),
+}
+
+CARD_PREFIX = '411111'  # Visa test range
+CARD_INDEX_DIGITS = 9  # Digits between the prefix and the check digit (so up to 10 ** 9 unique cards per generator)
+
+_LUHN_DOUBLED = (0, 2, 4, 6, 8, 1, 3, 5, 7, 9)  # Digit -> sum of the digits of its double
+
+
+def luhn_check_digit(digits):
+    """
+    :param digits: String of digits (a card number without its check digit)
+    :return: The check digit that makes the number Luhn-valid
+    """
+    total = 0
+    for position, digit in enumerate(reversed(digits)):
+        digit = int(digit)
+        total += _LUHN_DOUBLED[digit] if position % 2 == 0 else digit
+    return str(-total % 10)
+
+
+def luhn_valid(number):
+    return luhn_check_digit(number[:-1]) == number[-1]
+
+
+class DataGenerator(object):
+
+    def __init__(self, seed=None, email_domain='example.com', password='Password1'):
+        """
+        :param seed: Seed for the random choices (e.g. a fixed number to reproduce a run's data). Generators with
+        different seeds produce different emails and card numbers.
+        :param email_domain: Domain of generated email addresses
+        :param password: Password given to generated users
+        """
+        self.seed = random.randint(0, 2 ** 32 - 1) if seed is None else seed
+        self.random = random.Random(self.seed)
+        self.email_domain = email_domain
+        self.password = password
+        self._next_index = 0  # Index of the next user or card, so that every call gets new emails and card numbers
+
+        # Card numbers are a shuffled (rather than sequential) but still unique function of the index: multiplying by a
+        # number coprime to 10 ** CARD_INDEX_DIGITS is a bijection modulo that number
+        self.card_modulus = 10 ** CARD_INDEX_DIGITS
+        self.card_multiplier = self.random.randrange(1, self.card_modulus // 10) * 10 + self.random.choice((1, 3, 7, 9))
+        self.card_offset = self.random.randrange(self.card_modulus)
+
+    def email(self, index, first_name, last_name):
+        return '%s.%s.%x.%d@%s' % (first_name.lower(), last_name.lower(), self.seed, index, self.email_domain)
+
+    def card_number(self, index):
+        digits = CARD_PREFIX + '%0*d' % (
+            CARD_INDEX_DIGITS, (index * self.card_multiplier + self.card_offset) % self.card_modulus
+        )
+        return digits + luhn_check_digit(digits)
+
+    def _take_indices(self, count):
+        """
+        Yields the next `count` record indices (unlimited if None), advancing the generator's index as they're taken.
+        """
+        for _ in _indices(count):
+            index = self._next_index
+            self._next_index += 1
+            yield index
+
+    def postcode(self, postcode_format):
+        choice = self.random.choice
+        return ''.join(
+            choice('0123456789') if c == '9' else choice('ABCDEFGHJKLMNPRSTUVWXY') if c == 'A' else c
+            for c in postcode_format
+        )
+
+    def users(self, count=None, locale=None):
+        """
+        Yields unique Users (without IDs, i.e. not yet created in the ID service).
+        :param count: Number of users to generate (unlimited if None)
+        :param locale: Locale to give the users
+        """
+        choice = self.random.choice
+        for index in self._take_indices(count):
+            first_name, last_name = choice(FIRST_NAMES), choice(LAST_NAMES)
+            yield User(None, self.email(index, first_name, last_name), self.password, first_name, last_name,
+                       locale=locale)
+
+    def addresses(self, locale='NZ', count=None):
+        """
+        Yields Addresses in the format of the given locale.
+        :param locale: Country code (one of LOCALES)
+        :param count: Number of addresses to generate (unlimited if None)
+        """
+        streets, cities, street_format, second_line_formats, postcode_format = LOCALES[locale]
+        choice, randint = self.random.choice, self.random.randint
+        for _ in _indices(count):
+            yield Address(
+                address_one=street_format.format(number=randint(1, 999), street=choice(streets)),
+                address_two=choice(second_line_formats).format(number=randint(1, 20)),
+                city=choice(cities),
+                post_code=self.postcode(postcode_format),
+                country=locale
+            )
+
+    def credit_cards(self, count=None):
+        """
+        Yields CreditCards with unique, Luhn-valid numbers and expiration dates in the next few years.
+        :param count: Number of cards to generate (unlimited if None)
+        """
+        this_year = datetime.utcnow().year
+        randint = self.random.randint
+        for index in self._take_indices(count):
+            yield CreditCard(
+                card_number=self.card_number(index),
+                expiration_date=datetime(this_year + randint(1, 5), randint(1, 12), 1),
+                cvv=randint(100, 999)
+            )
+
+    def user_columns(self, count, locale=None):
+        """
+        :return: dict of User attribute -> list of values for `count` unique users
+        """
+        choice = self.random.choice
+        first_names = [choice(FIRST_NAMES) for _ in range(count)]
+        last_names = [choice(LAST_NAMES) for _ in range(count)]
+        indices = self._take_indices(count)
+        return {
+            'email': [self.email(i, first, last) for i, first, last in zip(indices, first_names, last_names)],
+            'password': [self.password] * count,
+            'first_name': first_names,
+            'last_name': last_names,
+            'locale': [locale] * count,
+        }
+
+    def address_columns(self, count, locale='NZ'):
+        """
+        :return: dict of Address attribute -> list of values for `count` addresses in the given locale
+        """
+        streets, cities, street_format, second_line_formats, postcode_format = LOCALES[locale]
+        choice, randint = self.random.choice, self.random.randint
+        return {
+            'address_one': [street_format.format(number=randint(1, 999), street=choice(streets)) for _ in range(count)],
+            'address_two': [choice(second_line_formats).format(number=randint(1, 20)) for _ in range(count)],
+            'city': [choice(cities) for _ in range(count)],
+            'post_code': [self.postcode(postcode_format) for _ in range(count)],
+            'country_code': [locale] * count,
+        }
+
+    def credit_card_columns(self, count):
+        """
+        :return: dict of CreditCard attribute -> values for `count` unique cards. Without numpy, the values are lists of
+        the attributes of credit_cards().
+
+        With numpy installed, the values are numpy arrays computed without per-card Python code. The card numbers are
+        the same as those of credit_cards(), but the expiration dates (datetime64[M], i.e. the first of the month) and
+        CVVs are drawn from a numpy random stream of their own, seeded from the generator's seed and the index of the
+        first card. They're just as reproducible, but different from those that would be produced without numpy.
+        """
+        if numpy is None:
+            cards = list(self.credit_cards(count))
+            return dict((attr, [getattr(card, attr) for card in cards])
+                        for attr in ('card_number', 'expiration_date', 'cvv'))
+
+        start = self._next_index
+        self._next_index += count
+        indices = numpy.arange(start, start + count, dtype=numpy.int64)
+        payload = (indices * self.card_multiplier + self.card_offset) % self.card_modulus + \
+            int(CARD_PREFIX) * self.card_modulus
+
+        # Luhn check digits, a digit position at a time (the rightmost digit of the payload is doubled)
+        total = numpy.zeros(count, dtype=numpy.int64)
+        doubled = numpy.array(_LUHN_DOUBLED)
+        digits = payload.copy()
+        for position in range(len(CARD_PREFIX) + CARD_INDEX_DIGITS):
+            digit = digits % 10
+            total += doubled[digit] if position % 2 == 0 else digit
+            digits //= 10
+
+        # Seeded by the first index too, so that each batch gets different dates and CVVs. Numpy versions before 1.17
+        # (the last for Python 2 is 1.16) only have RandomState.
+        seed = [self.seed % 2 ** 32, start % 2 ** 32]
+        if hasattr(numpy.random, 'default_rng'):
+            integers = numpy.random.default_rng(seed).integers
+        else:
+            integers = numpy.random.RandomState(seed).randint
+
+        # Months since 1970, from next year to five years' time (as in credit_cards)
+        this_year = datetime.utcnow().year
+        months = (integers(this_year + 1, this_year + 6, count) - 1970) * 12 + integers(0, 12, count)
+        return {
+            'card_number': (payload * 10 + (-total % 10)).astype('U%d' % (len(CARD_PREFIX) + CARD_INDEX_DIGITS + 1)),
+            'expiration_date': months.astype('datetime64[M]'),
+            'cvv': integers(100, 1000, count),
+        }
+
+
+def _indices(count):
+    return itertools.count() if count is None else range(count)
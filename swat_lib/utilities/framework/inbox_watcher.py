@@ -0,0 +1,227 @@
+"""
+Session-wide watcher of the test inbox, so that tests waiting for emails share one IMAP connection and one stream of
+new messages, instead of each polling the inbox with its own search loop.
+
+Tests register what they're expecting (criteria like those of EmailQuery, e.g. the test-specific recipient and a
+subject) and get a future back, which is resolved with the matching Email (body included) once it arrives:
+
+    future = inbox_watcher.watch({'to': test_specific_email, 'subject': 'Reset your password'})  # Before sending
+    id_api.send_reset_password(test_specific_email)
+    email = future.result(timeout=120)
+"""
+import re
+import threading
+from collections import deque
+
+from concurrent.futures import Future
+
+from framework.emails import Email, ImapHelper, parse_message
+
+
+def header_contains(email, header, value):
+    return value.lower() in str(email.message.get(header, '')).lower()
+
+
+# Criteria -> function of (Email, value) checking whether the email matches. Like IMAP searches, strings match
+# case-insensitive substrings of the headers.
+MATCHERS = {
+    'subject': lambda email, value: header_contains(email, 'Subject', value),
+    'from': lambda email, value: header_contains(email, 'From', value),
+    'to': lambda email, value: header_contains(email, 'To', value) or header_contains(email, 'Delivered-To', value),
+    'message_id': lambda email, value: str(email.message_id or '').strip() == value.strip(),
+}
+
+
+def matches(email, criteria):
+    """
+    :param email: Email (headers only is enough)
+    :param criteria: dict of MATCHERS criterion -> value
+    :return: Whether the email matches all of the criteria
+    """
+    return all(MATCHERS[criterion](email, value) for criterion, value in criteria.items())
+
+
+SEEN_LIMIT = 100  # Number of recently arrived emails kept for expectations registered with include_seen
+
+
+class Expectation(object):
+    """
+    An email that a test is waiting for.
+    """
+    __slots__ = ('criteria', 'future', 'include_seen')
+
+    def __init__(self, criteria, include_seen):
+        self.criteria = criteria
+        self.future = Future()
+        self.include_seen = include_seen  # Whether emails that had already arrived when it was registered can match
+
+
+class InboxWatcher(object):
+    """
+    Owns a single IMAP connection (on a background thread), which picks up new messages by UID, fetching only their
+    headers, and dispatches them to the outstanding expectations. Only matched emails are fetched in full.
+
+    imaplib connections aren't thread-safe, so the connection is only ever used by the watcher's thread.
+    """
+
+    def __init__(self, email_address, email_password, logger, poll_interval=5, delete_emails=True):
+        """
+        :param email_address: Address of the inbox to watch (plus-addressed variants are delivered to it too)
+        :param email_password: Password of the inbox
+        :param logger: Log to report connection errors to
+        :param poll_interval: Number of seconds between checks for new messages
+        :param delete_emails: Whether to move the emails that were dispatched to tests to the trash, on stop
+        """
+        # The helper's connections don't delete anything on exit (which would happen on every reconnect): dispatched
+        # emails are moved to the trash once, in stop()
+        self.helper = ImapHelper(email_address, email_password, logger, delete_emails=False)
+        self.delete_emails = delete_emails
+        self.log = logger
+        self.poll_interval = poll_interval
+        self.expectations = []
+        self.seen = deque(maxlen=SEEN_LIMIT)  # The latest emails (headers only) to have arrived
+        self.last_uid = None  # Highest UID that has been checked
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='InboxWatcher')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=30):
+        """
+        Stops the watcher, cancelling any outstanding expectations, and moves the emails that were dispatched to the
+        trash (if delete_emails).
+        """
+        self.stopping.set()
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join(timeout)
+        with self.lock:
+            expectations, self.expectations = self.expectations, []
+        for expectation in expectations:
+            expectation.future.cancel()
+
+        if self.delete_emails and self.helper.uids:
+            try:
+                with self.helper.connection() as conn:
+                    self.helper.delete_processed_emails(conn)
+                self.helper.uids = []
+            except Exception as e:
+                self.log.warning('Inbox watcher could not delete the emails it dispatched: %s' % e)
+
+    def watch(self, criteria, include_seen=False):
+        """
+        Registers an expected email. Returns at once. By default only emails that arrive from now on match, so the
+        expectation should be registered before the email is triggered.
+        :param criteria: dict of criteria (see MATCHERS), e.g. {'to': ..., 'subject': ...}
+        :param include_seen: Whether one of the last SEEN_LIMIT emails to arrive (since the watcher started) can match
+        it, if it arrived before this call. Only safe if no earlier email could match the criteria (e.g. a recipient
+        that's unique to the test).
+        :return: Future of the matching Email. It can be cancelled to stop waiting.
+        """
+        unknown = set(criteria).difference(MATCHERS)
+        if unknown:
+            raise ValueError('Unsupported criteria for watching the inbox: %s' % ', '.join(sorted(unknown)))
+
+        expectation = Expectation(dict(criteria), include_seen)
+        with self.lock:
+            self.expectations.append(expectation)
+        self.wakeup.set()  # Check it against the emails already seen straight away
+        return expectation.future
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                with self.helper.connection() as conn:
+                    if self.last_uid is None:
+                        self.last_uid = self.get_uid_next(conn) - 1
+                    while not self.stopping.is_set():
+                        self.poll(conn)
+                        self.wakeup.wait(self.poll_interval)
+                        self.wakeup.clear()
+            except Exception as e:
+                # Most likely a dropped connection: reconnect after a pause (new messages are found by UID, so none are
+                # missed in the meantime)
+                self.log.warning('Inbox watcher error (reconnecting): %s' % e)
+                self.stopping.wait(self.poll_interval)
+
+    @staticmethod
+    def get_uid_next(conn):
+        status, data = conn.status('INBOX', '(UIDNEXT)')
+        ImapHelper.validate_results(status, data)
+        return int(re.search(br'UIDNEXT (\d+)', data[0]).group(1))
+
+    def poll(self, conn):
+        with self.lock:
+            expectations = [expectation for expectation in self.expectations if not expectation.future.done()]
+            new_expectations = [expectation for expectation in expectations if expectation.include_seen]
+            for expectation in new_expectations:
+                expectation.include_seen = False  # Only needs checking against the emails already seen once
+            self.expectations = expectations
+
+        # Expectations registered since the last poll may match emails that have already arrived (latest first)
+        for expectation in new_expectations:
+            for email in reversed(self.seen):
+                if matches(email, expectation.criteria):
+                    self.resolve(conn, [expectation], email)
+                    break
+
+        for email in self.fetch_new_headers(conn):
+            self.seen.append(email)
+            with self.lock:
+                matched = [expectation for expectation in self.expectations
+                           if not expectation.future.done() and matches(email, expectation.criteria)]
+            if matched:
+                self.resolve(conn, matched, email)
+
+    def fetch_new_headers(self, conn):
+        """
+        :return: List of the Emails (headers only) that have arrived since the last poll, in order of arrival
+        """
+        conn.noop()  # Lets the server report new messages
+        status, data = conn.uid('search', None, '(UID %d:*)' % (self.last_uid + 1))
+        ImapHelper.validate_results(status, data)
+
+        # 'n:*' always includes the highest UID, even if it's lower than n
+        uids = [uid for uid in map(int, data[0].split()) if uid > self.last_uid]
+        if not uids:
+            return []
+
+        status, data = conn.uid('fetch', ','.join(map(str, uids)), '(UID BODY.PEEK[HEADER])')
+        ImapHelper.validate_results(status, data)
+        self.last_uid = max(uids)
+
+        emails = []
+        for item in data:
+            if isinstance(item, tuple):  # Other items are the closing parentheses of each message
+                metadata, raw_headers = item
+                uid = int(re.search(br'UID (\d+)', metadata).group(1))
+                emails.append(Email(uid).load(parse_message(raw_headers, headers_only=True), headers_only=True))
+        return sorted(emails, key=lambda email: email.uid)
+
+    def resolve(self, conn, expectations, email):
+        """
+        Fetches the email in full and resolves the expectations with it.
+        """
+        try:
+            full_email = self.helper.get_email_by_id(conn, email.uid)
+        except Exception as e:
+            for expectation in expectations:
+                if expectation.future.set_running_or_notify_cancel():
+                    expectation.future.set_exception(e)
+            return
+
+        if email.uid not in self.helper.uids:
+            self.helper.uids.append(email.uid)  # Deleted when the watcher stops (if delete_emails)
+        with self.lock:
+            for expectation in expectations:
+                if expectation in self.expectations:
+                    self.expectations.remove(expectation)
+        for expectation in expectations:
+            if expectation.future.set_running_or_notify_cancel():
+                expectation.future.set_result(full_email)
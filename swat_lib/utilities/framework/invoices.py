@@ -0,0 +1,128 @@
+"""
+Structured parsing of invoice PDFs (e.g. from EcomAPI.get_me_invoice), so that checks can compare fields rather than
+regexing the whole text of the document.
+
+Pages are extracted lazily (see framework.files.PdfPages), and parsing stops as soon as the requested fields have been
+found, so a check that only needs the order ID or the total usually only pays for laying out the first page:
+
+    invoice = parse_invoice(ecom_api.get_me_invoice(access_token, order_id).content, fields=('order_id', 'total'))
+    assert invoice.total == Decimal('99.00')
+"""
+import re
+from collections import namedtuple
+from decimal import Decimal
+
+from framework.files import PdfPages
+
+
+LineItem = namedtuple('LineItem', ['description', 'quantity', 'amount'])
+
+
+class Invoice(object):
+    """
+    Fields parsed from an invoice. Fields that weren't requested, or couldn't be found, are None.
+    """
+    __slots__ = ('order_id', 'subtotal', 'tax', 'total', 'line_items', 'pages_parsed')
+
+    def __init__(self):
+        self.order_id = None
+        self.subtotal = None  # Amounts are Decimals
+        self.tax = None
+        self.total = None
+        self.line_items = None  # List of LineItems
+        self.pages_parsed = 0
+
+    def __repr__(self):
+        return 'Invoice(%s)' % ', '.join('%s=%r' % (field, getattr(self, field)) for field in self.__slots__)
+
+
+def _amount(text):
+    return Decimal(text.replace(',', ''))
+
+
+class InvoiceParser(object):
+    """
+    Parses Invoices from PDF byte strings. The patterns can be overridden (e.g. in a subclass) for invoices with
+    different wording; each must have a single group, containing the value of the field.
+    """
+    FIELDS = ('order_id', 'subtotal', 'tax', 'total', 'line_items')
+
+    AMOUNT = r'[^\d\s-]{0,3}\s*(-?[\d,]+\.\d{2})'  # An amount, optionally preceded by a currency symbol or code
+    LINE_END = r'(?:[^\S\n]*[A-Z]{3})?[^\S\n]*$'  # The end of a line, optionally after a currency code
+
+    # The tax and total are the amounts at the end of their lines, whatever comes between the label and the amount
+    # (e.g. 'GST (15%): $1.50' or 'Total (incl. GST 15%): $11.50'). The tax label must start its line (after at most
+    # one other word, e.g. 'Sales Tax' or 'Total GST'), so that it isn't found in the total's line.
+    patterns = {
+        'order_id': re.compile(r'Order\s*(?:ID|Number|No\.?|#)\s*:?\s*#?\s*([\w-]+)', re.I),
+        'subtotal': re.compile(r'Sub-?\s?total\s*:?\s*' + AMOUNT, re.I),
+        'tax': re.compile(
+            r'^[^\S\n]*(?:\w+[^\S\n]+)?(?:Tax|GST|VAT)\b[^\n]*?' + AMOUNT + LINE_END, re.I | re.M
+        ),
+        'total': re.compile(
+            r'^\s*(?:Grand\s+|Invoice\s+)?Total\b(?![^\S\n]*(?:Tax|GST|VAT)\b)[^\n]*?' + AMOUNT + LINE_END, re.I | re.M
+        ),
+    }
+
+    # E.g. 'Serato DJ Pro    1    $129.00'
+    line_item = re.compile(r'^(?P<description>\S.*?)\s+(?P<quantity>\d+)\s+' + AMOUNT + r'\s*$', re.M)
+
+    converters = {
+        'subtotal': _amount,
+        'tax': _amount,
+        'total': _amount,
+    }
+
+    def parse(self, byte_string, fields=None):
+        """
+        :param byte_string: Invoice PDF
+        :param fields: Fields to find (see FIELDS; defaults to all of them). Parsing stops at the first page on which
+        all of them have been found. Line items are complete once the total has been found.
+        :return: Invoice
+        """
+        fields = set(fields or self.FIELDS)
+        unknown = fields.difference(self.FIELDS)
+        if unknown:
+            raise ValueError('Unknown invoice fields: %s' % ', '.join(sorted(unknown)))
+
+        invoice = Invoice()
+        scalar_fields = [field for field in self.FIELDS if field in fields and field != 'line_items']
+        if 'line_items' in fields:
+            invoice.line_items = []
+            if 'total' not in scalar_fields:
+                scalar_fields.append('total')  # Needed to know when the line items end
+
+        for text in PdfPages(byte_string):
+            invoice.pages_parsed += 1
+
+            # Line items end at the total, so only look for them before it
+            total_match = None
+            if invoice.total is None:
+                total_match = self.patterns['total'].search(text)
+            if invoice.line_items is not None and invoice.total is None:
+                items_text = text[:total_match.start()] if total_match else text
+                invoice.line_items.extend(
+                    LineItem(match.group('description'), int(match.group('quantity')), _amount(match.group(3)))
+                    for match in self.line_item.finditer(items_text)
+                )
+
+            for field in scalar_fields:
+                if getattr(invoice, field) is None:
+                    match = total_match if field == 'total' else self.patterns[field].search(text)
+                    if match:
+                        convert = self.converters.get(field, lambda value: value)
+                        setattr(invoice, field, convert(match.group(1)))
+
+            if all(getattr(invoice, field) is not None for field in scalar_fields):
+                break
+
+        if 'total' not in fields:
+            invoice.total = None  # Only found to delimit the line items
+        return invoice
+
+
+def parse_invoice(byte_string, fields=None):
+    """
+    Parses an invoice PDF with the default InvoiceParser (see InvoiceParser.parse).
+    """
+    return InvoiceParser().parse(byte_string, fields)
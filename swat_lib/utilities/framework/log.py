@@ -139,10 +139,13 @@ class LogFormat(object):
 
         Adapted from spec/deprecated/WEB/API/common/request_debugger.py
         """
-        try:
-            body = pformat(response.json())
-        except ValueError:
-            body = 'None'  # Stop errors for requests without a json response
+        if not getattr(response, '_content_consumed', True):
+            body = '(streamed)'  # Reading the body here would defeat the point of streaming it
+        else:
+            try:
+                body = pformat(response.json())
+            except ValueError:
+                body = 'None'  # Stop errors for requests without a json response
 
         return MultilineMessage(
             '',
@@ -3,7 +3,15 @@
 from datetime import datetime
 
 
+_record_keys = {}  # (Model class, attribute names) -> function returned by Model.record_key
+
+
 class Model(object):
+    __slots__ = ()  # So that subclasses can use __slots__ (see ResponseModel)
+
+    # Attribute name -> keys to look for its value under in response data, in order of preference (for attributes
+    # that aren't stored under their own name)
+    data_keys = {}
 
     def matches(self, other, attrs_to_match=None):
         """
@@ -25,18 +33,121 @@ class Model(object):
         """
         Compares the attributes in the `attrs` list for the two objects (self and other), returning true if they are
         identical.
-        TODO Use dictionary comprehension syntax if we upgrade to Python 3
         """
-        this_dict = dict([(k, v) for k, v in self.__dict__.items() if k in attrs])
-        other_dict = dict([(k, v) for k, v in other.__dict__.items() if k in attrs])
-        return this_dict == other_dict
+        return self.key(attrs) == other.key(attrs)
+
+    def key(self, attrs):
+        """
+        :return: Tuple of the values of the given attributes (for comparing or indexing objects). Attributes that the
+        object doesn't have are None, as are keys missing from response data (see data_getter), so that a model matches
+        the data it was loaded from.
+        """
+        return tuple([getattr(self, attr, None) for attr in attrs])
+
+    def find_matches(self, records, attrs_to_match=None):
+        """
+        :param records: List of dictionaries of response data (e.g. response.json()['items']) and/or models
+        :param attrs_to_match: List of attributes to match against
+        :return: List of the records that match this object, without creating a model for each record
+        """
+        attrs = tuple(attrs_to_match or self.default_comparison_attrs)
+        record_key = type(self).record_key(attrs)
+        key = self.key(attrs)
+        return [record for record in records if record_key(record) == key]
+
+    @classmethod
+    def record_key(cls, attrs):
+        """
+        :param attrs: Tuple of attribute names
+        :return: Function that returns the key (see Model.key) of a dictionary of response data, or of a model
+        """
+        try:
+            return _record_keys[(cls, attrs)]
+        except KeyError:
+            pass
+
+        getters = [cls.data_getter(attr) for attr in attrs]
+
+        def record_key(record):
+            if isinstance(record, Model):
+                return record.key(attrs)
+            return tuple([get(record) for get in getters])
+
+        _record_keys[(cls, attrs)] = record_key
+        return record_key
+
+    @classmethod
+    def data_getter(cls, attr):
+        """
+        :return: Function that returns the value of an attribute from a dictionary of response data. If the attribute
+        has several data_keys, the first non-empty value is used. The value is None if none of the keys are in the
+        data, as in Model.key.
+        """
+        keys = cls.data_keys.get(attr, (attr,))
+        if len(keys) == 1:
+            key = keys[0]
+            return lambda data: data.get(key)
+
+        def get(data):
+            value = None
+            for key in keys:
+                value = data.get(key)
+                if value:
+                    break
+            return value
+
+        return get
+
+
+class ModelIndex(object):
+    """
+    Index of response records (dictionaries of response data, or models), for matching many expected models against a
+    large list of records in O(n) time overall, e.g.
+
+        index = ModelIndex(User, id_api.get_users().json()['items'])
+        missing_users = [user for user in expected_users if not index.find(user)]
+    """
+
+    def __init__(self, model_class, records, attrs=None):
+        """
+        :param model_class: Model class that the records represent (for its data_keys)
+        :param records: Iterable of dictionaries of response data and/or models
+        :param attrs: Attributes to match on (defaults to the class's default_comparison_attrs)
+        """
+        self.attrs = tuple(attrs or model_class.default_comparison_attrs)
+        record_key = model_class.record_key(self.attrs)
+        self.records = {}
+        for record in records:
+            self.records.setdefault(record_key(record), []).append(record)
+
+    def find(self, model):
+        """
+        :return: List of the records that match the given model (empty if there are none)
+        """
+        return self.records.get(model.key(self.attrs), [])
+
+    def __contains__(self, model):
+        return model.key(self.attrs) in self.records
+
+    def __len__(self):
+        return len(self.records)
 
 
-class User(Model):
+class BaseUser(Model):
+    """
+    Attributes and defaults shared by User and HashableUser.
+    """
+    __slots__ = ()
 
     # Attributes used to uniquely identify the user
     default_comparison_attrs = ['id', 'email']
 
+    data_keys = {
+        'id': ('id', 'user_id'),
+        'email': ('email_address', 'email'),
+        'date_created': ('timestamp', 'date_created'),
+    }
+
     def __init__(self, user_id, email, password=None, first_name=None, last_name=None, date_created=None, locale=None):
         self.id = user_id
         self.email = email
@@ -51,17 +162,19 @@ class User(Model):
         Checks whether the given user_data dictionary / response body has data that identifies it as the same user as
         this one.
         """
-        other_user = User.load_from(user_data)
-        return super(User, self).matches(other_user, attrs_to_match)
+        attrs = tuple(attrs_to_match or self.default_comparison_attrs)
+        return type(self).record_key(attrs)(user_data) == self.key(attrs)
+
+
+class User(BaseUser):
 
     @staticmethod
     def data_matches(this_user_data, other_user_data, attrs_to_match=None):
         """
         Checks whether two dictionaries of user data refer to the same user.
         """
-        this_user = User.load_from(this_user_data)
-        other_user = User.load_from(other_user_data)
-        return super(User, this_user).matches(other_user, attrs_to_match)
+        record_key = User.record_key(tuple(attrs_to_match or User.default_comparison_attrs))
+        return record_key(this_user_data) == record_key(other_user_data)
 
     @staticmethod
     def load_from(user_data):
@@ -75,9 +188,17 @@ class User(Model):
         return User(**data)
 
 
-class Address(Model):
+class BaseAddress(Model):
+    """
+    Attributes and defaults shared by Address and HashableAddress.
+    """
+    __slots__ = ()
 
-    default_comparison_attrs = ['address_one', 'address_two', 'city', 'post_code', 'country']
+    default_comparison_attrs = ['address_one', 'address_two', 'city', 'post_code', 'country_code']
+
+    data_keys = {
+        'country_code': ('country_code', 'country'),
+    }
 
     def __init__(self, address_one=None, address_two=None, city=None, post_code=None, country=None):
         self.address_one = address_one or '4 Test Drive'
@@ -87,7 +208,15 @@ class Address(Model):
         self.country_code = country or 'NZ'
 
 
-class CreditCard(Model):
+class Address(BaseAddress):
+    pass
+
+
+class BaseCreditCard(Model):
+    """
+    Attributes and defaults shared by CreditCard and HashableCreditCard.
+    """
+    __slots__ = ()
 
     default_comparison_attrs = ['card_number', 'expiration_date', 'cvv']
 
@@ -104,9 +233,302 @@ class CreditCard(Model):
             return self.expiration_date.strftime('%m/%y')
 
 
-class Coupon(Model):
+class CreditCard(BaseCreditCard):
+    pass
+
+
+class BaseCoupon(Model):
+    """
+    Attributes and defaults shared by Coupon and HashableCoupon.
+    """
+    __slots__ = ()
 
     default_comparison_attrs = ['coupon_code']
 
     def __init__(self, coupon_code=None):
         self.coupon_code = coupon_code or '25OFFEXPPACKS'
+
+
+class Coupon(BaseCoupon):
+    pass
+
+
+class HashableModel(Model):
+    """
+    Base class for slotted, hashable versions of the models above, which can be put in sets and used as dictionary
+    keys (e.g. to dedupe test data, or to diff expected and actual objects with set operations). Objects are equal if
+    they're of the same type and their default_comparison_attrs are equal.
+
+    Each hashable model shares its attributes, defaults and methods with the original through a Base* class (e.g.
+    HashableUser and User both extend BaseUser), and only declares the __slots__ to store them in.
+
+    The identity tuple is computed once, the first time it's needed, so the identifying attributes of an object
+    shouldn't be changed after it has been put in a set or used as a key.
+    """
+    __slots__ = ('_identity',)
+
+    @property
+    def identity(self):
+        try:
+            return self._identity
+        except AttributeError:
+            self._identity = self.key(self.default_comparison_attrs)
+            return self._identity
+
+    @classmethod
+    def from_model(cls, model):
+        """
+        Creates a hashable copy of a model (e.g. HashableUser.from_model(user)), without re-applying any defaults.
+        """
+        copy = cls.__new__(cls)
+        for attr in cls.__slots__:
+            setattr(copy, attr, getattr(model, attr, None))
+        return copy
+
+    def __eq__(self, other):
+        return type(other) is type(self) and other.identity == self.identity
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.identity)
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join('%s=%r' % item for item in zip(
+            self.default_comparison_attrs, self.identity
+        )))
+
+
+class HashableUser(BaseUser, HashableModel):
+    __slots__ = ('id', 'email', 'password', 'first_name', 'last_name', 'date_created', 'locale')
+
+    @classmethod
+    def load_from(cls, user_data):
+        """
+        Creates a HashableUser from a response body / dictionary of user data (without copying it, and ignoring any
+        keys that aren't user attributes)
+        """
+        get = user_data.get
+        return cls(
+            get('id') or get('user_id'),
+            get('email_address') or get('email'),
+            get('password'),
+            get('first_name'),
+            get('last_name'),
+            get('timestamp') or get('date_created'),
+            get('locale')
+        )
+
+
+class HashableAddress(BaseAddress, HashableModel):
+    __slots__ = ('address_one', 'address_two', 'city', 'post_code', 'country_code')
+
+
+class HashableCreditCard(BaseCreditCard, HashableModel):
+    __slots__ = ('card_number', 'expiration_date', 'cvv')
+
+
+class HashableCoupon(BaseCoupon, HashableModel):
+    __slots__ = ('coupon_code',)
+
+
+def parse_timestamp(value):
+    """
+    :param value: ISO 8601 timestamp or date from a response body (e.g. '2018-05-31T01:02:03Z' or '2018-05-31')
+    :return: datetime, or the original value if it isn't in a recognised format
+    """
+    for timestamp_format in ('%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%dT%H:%M:%S.%fZ', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, timestamp_format)
+        except (TypeError, ValueError):
+            pass
+    return value
+
+
+class lazy_field(object):
+    """
+    Descriptor for a ResponseModel field that is converted from the decoded JSON when it's first accessed (rather than
+    when the model is created), e.g. timestamps and nested lists of items. Until then, the model keeps the raw value.
+    """
+
+    def __init__(self, key, convert):
+        """
+        :param key: Key of the value in the decoded JSON
+        :param convert: Callable that converts the value (not called if the value is missing or None)
+        """
+        self.key = key
+        self.convert = convert
+
+    def __get__(self, model, owner):
+        if model is None:
+            return self
+        if model._cache is None:
+            model._cache = {}
+        try:
+            return model._cache[self.key]
+        except KeyError:
+            value = model._raw.pop(self.key, None) if model._raw else None
+            value = model._cache[self.key] = self.convert(value) if value is not None else None
+            return value
+
+
+class ResponseModel(Model):
+    """
+    Base class for compact models of items from API responses (e.g. ecom orders or licenses). Fields are stored in
+    __slots__ rather than a __dict__, which makes large listings much smaller in memory and attribute lookups faster.
+
+    Subclasses list the fields that are copied straight from the decoded JSON as (attribute name, JSON key) pairs in
+    `fields`, and declare the corresponding __slots__. Fields that need converting are declared as lazy_fields instead.
+    Fields that aren't in a response are None.
+
+    Models don't keep a reference to the decoded JSON they're created from (only to the raw values of their lazy fields,
+    until they're converted), so the rest of it can be freed.
+    """
+    __slots__ = ('_raw', '_cache')
+
+    fields = ()
+    default_comparison_attrs = ['id']
+
+    def __init__(self, data):
+        """
+        :param data: Decoded JSON of the item (e.g. one of response.json()['items'])
+        """
+        for attr, key in self.fields:
+            setattr(self, attr, data.get(key))
+        raw = dict((key, data[key]) for key in self.lazy_keys() if data.get(key) is not None)
+        self._raw = raw or None  # JSON key -> raw value, for lazy fields that haven't been converted yet
+        self._cache = None  # JSON key -> converted value, for lazy fields that have
+
+    @classmethod
+    def lazy_keys(cls):
+        """
+        :return: Tuple of the JSON keys of the class's lazy_fields
+        """
+        keys = cls.__dict__.get('_lazy_keys')
+        if keys is None:
+            keys = tuple(sorted(set(
+                field.key for name in dir(cls) for field in [getattr(cls, name)] if isinstance(field, lazy_field)
+            )))
+            setattr(cls, '_lazy_keys', keys)
+        return keys
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data)
+
+    @classmethod
+    def data_getter(cls, attr):
+        # Fields that aren't in the data are None on models, and lazy fields are converted, so do the same here
+        field = getattr(cls, attr, None)
+        if isinstance(field, lazy_field):
+            return lambda data: field.convert(data[field.key]) if data.get(field.key) is not None else None
+        key = dict(cls.fields).get(attr, attr)
+        return lambda data: data.get(key)
+
+    @classmethod
+    def list_from(cls, items):
+        """
+        :param items: List of decoded JSON items
+        :return: List of models
+        """
+        return [cls(item) for item in items]
+
+    def __repr__(self):
+        fields = ', '.join('%s=%r' % (attr, getattr(self, attr)) for attr, _ in self.fields)
+        return '%s(%s)' % (type(self).__name__, fields)
+
+
+class PlanChange(ResponseModel):
+    fields = (('id', 'id'), ('product_type_id', 'product_type_id'), ('status', 'status'))
+    __slots__ = tuple(attr for attr, _ in fields)
+
+    created_at = lazy_field('created_at', parse_timestamp)
+
+
+class Subscription(ResponseModel):
+    fields = (
+        ('id', 'id'),
+        ('status', 'status'),
+        ('product_type_id', 'product_type_id'),
+        ('payment_method_token', 'payment_method_token'),
+        ('number_of_billing_cycles', 'number_of_billing_cycles'),
+    )
+    __slots__ = tuple(attr for attr, _ in fields)
+
+    created_at = lazy_field('created_at', parse_timestamp)
+    next_billing_date = lazy_field('next_billing_date', parse_timestamp)
+    plan_changes = lazy_field('plan_changes', PlanChange.list_from)
+
+
+class PaymentMethod(ResponseModel):
+    fields = (
+        ('token', 'token'),
+        ('type', 'type'),
+        ('card_type', 'card_type'),
+        ('last_four', 'last_four'),
+        ('billing_address_id', 'billing_address_id'),
+        ('default', 'default'),
+    )
+    __slots__ = tuple(attr for attr, _ in fields)
+    default_comparison_attrs = ['token']
+
+    expiration_date = lazy_field('expiration_date', parse_timestamp)
+
+
+class Order(ResponseModel):
+    fields = (
+        ('id', 'id'),
+        ('status', 'order_status'),
+        ('total', 'total'),
+        ('currency', 'currency'),
+        ('magento_order_id', 'magento_order_id'),
+    )
+    __slots__ = tuple(attr for attr, _ in fields)
+
+    created_at = lazy_field('created_at', parse_timestamp)
+    items = lazy_field('items', list)
+
+
+class Authorization(ResponseModel):
+    fields = (
+        ('id', 'id'),
+        ('action', 'action'),
+        ('app_name', 'app_name'),
+        ('app_version', 'app_version'),
+        ('host_machine_id', 'host_machine_id'),
+        ('host_machine_name', 'host_machine_name'),
+        ('status_code', 'status_code'),
+    )
+    __slots__ = tuple(attr for attr, _ in fields)
+
+    created_at = lazy_field('created_at', parse_timestamp)
+
+
+class License(ResponseModel):
+    fields = (
+        ('id', 'id'),
+        ('type', 'license_type'),
+        ('product_id', 'product_id'),
+        ('activation_limit', 'activation_limit'),
+    )
+    __slots__ = tuple(attr for attr, _ in fields)
+
+    valid_to = lazy_field('valid_to', parse_timestamp)
+    authorizations = lazy_field('authorizations', Authorization.list_from)
+
+
+class Product(ResponseModel):
+    fields = (
+        ('id', 'id'),
+        ('product_type_id', 'product_type_id'),
+        ('name', 'name'),
+        ('user_id', 'user_id'),
+        ('subscription_status', 'subscription_status'),
+        ('product_serial_number', 'product_serial_number'),
+    )
+    __slots__ = tuple(attr for attr, _ in fields)
+
+    date_created = lazy_field('date_created', parse_timestamp)
+    valid_to = lazy_field('valid_to', parse_timestamp)
+    licenses = lazy_field('licenses', License.list_from)
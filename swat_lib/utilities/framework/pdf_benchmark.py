@@ -0,0 +1,131 @@
+"""
+Benchmark of the two ways of extracting text from invoices (see framework.files.pdf_bytestring_to_text): in-process
+with pdfminer, straight from memory, and with a pdf2txt subprocess per invoice.
+
+Invoices can be saved to a corpus directory from a stack with save_invoices, e.g.
+
+    save_invoices(ecom_api, access_token, 'invoices')
+
+and then benchmarked with
+
+    python -m framework.pdf_benchmark invoices [repeat]
+
+(The subprocess path needs the VIRTUAL_ENV environment variable, pointing at a virtualenv with pdfminer installed.)
+"""
+import os
+import sys
+from timeit import default_timer
+
+from framework.api.metrics import Histogram
+from framework.files import pdf_bytestring_to_text
+
+
+METHODS = (
+    ('in-process', lambda invoice: pdf_bytestring_to_text(invoice, in_process=True)),
+    ('subprocess', lambda invoice: pdf_bytestring_to_text(invoice, in_process=False)),
+)
+
+
+def save_invoices(ecom_api, access_token, directory, order_ids=None, user_id=None):
+    """
+    Saves invoices to a directory, as a corpus for the benchmark.
+    :param ecom_api: EcomAPI to fetch the invoices with
+    :param access_token: Access token of the logged in user
+    :param directory: Directory to save the invoices in (created if it doesn't exist)
+    :param order_ids: IDs of the orders to save the invoices of (defaults to all of the user's orders)
+    :param user_id: If given, invoices are fetched with GET /users/{user_id}/orders/{order_id}/invoice rather than
+    GET /me/orders/{order_id}/invoice
+    :return: List of the paths of the saved invoices
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    if order_ids is None:
+        if user_id:
+            orders = ecom_api.get_user_orders(access_token, user_id=user_id).json()['items']
+        else:
+            orders = ecom_api.get_me_orders(access_token).json()['items']
+        order_ids = [order['id'] for order in orders]
+
+    paths = []
+    for order_id in order_ids:
+        if user_id:
+            response = ecom_api.get_user_invoice(access_token, order_id, user_id)
+        else:
+            response = ecom_api.get_me_invoice(access_token, order_id)
+
+        path = os.path.join(directory, 'invoice_%s.pdf' % order_id)
+        with open(path, 'wb') as f:
+            f.write(response.content)
+        paths.append(path)
+
+    return paths
+
+
+def load_invoices(directory):
+    """
+    :return: List of the contents of the PDFs in the directory
+    """
+    invoices = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith('.pdf'):
+            with open(os.path.join(directory, name), 'rb') as f:
+                invoices.append(f.read())
+    return invoices
+
+
+def benchmark(invoices, repeat=3):
+    """
+    Extracts the text of every invoice with each method, `repeat` times.
+    :param invoices: List of PDF byte strings
+    :return: dict of method name -> Histogram of the time taken per invoice (in microseconds)
+    """
+    results = {}
+    for name, extract in METHODS:
+        histogram = results[name] = Histogram()
+        for _ in range(repeat):
+            for invoice in invoices:
+                start = default_timer()
+                extract(invoice)
+                histogram.record((default_timer() - start) * 1e6)
+    return results
+
+
+def summary_lines(results):
+    row_format = '%-12s %8s %10s %9s %9s %9s %9s'
+    lines = [row_format % ('Method', 'Runs', 'Total s', 'Mean ms', 'p50 ms', 'p90 ms', 'Max ms')]
+    for name, _ in METHODS:
+        histogram = results[name]
+        lines.append(row_format % (
+            name,
+            histogram.count,
+            '%.2f' % (histogram.total / 1e6),
+            '%.1f' % (histogram.mean / 1e3),
+            '%.1f' % (histogram.percentile(50) / 1e3),
+            '%.1f' % (histogram.percentile(90) / 1e3),
+            '%.1f' % (histogram.max / 1e3)
+        ))
+
+    in_process, subprocess = results['in-process'], results['subprocess']
+    if in_process.total:
+        lines.append('In-process extraction is %.1fx faster' % (float(subprocess.total) / in_process.total))
+    return lines
+
+
+def main(args):
+    if not args:
+        print('Usage: python -m framework.pdf_benchmark <invoice directory> [repeat]')
+        return 2
+
+    invoices = load_invoices(args[0])
+    if not invoices:
+        print('No PDFs found in %s' % args[0])
+        return 1
+
+    results = benchmark(invoices, int(args[1]) if len(args) > 1 else 3)
+    print('\n'.join(['%d invoices' % len(invoices)] + summary_lines(results)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
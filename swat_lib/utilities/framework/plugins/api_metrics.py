@@ -0,0 +1,45 @@
+import os
+
+from framework.api.metrics import api_metrics
+
+
+"""
+Plugin for summarising the API calls made during a session (see framework.api.metrics), so that we can see which
+endpoints dominate suite time. The summary is logged at the end of the session, and exported to the output directory
+as JSON and as a Prometheus textfile.
+"""
+
+json_filename = 'api_metrics.json'
+prometheus_filename = 'api_metrics.prom'
+
+
+def pytest_sessionstart(session):
+    api_metrics.reset()
+
+
+def pytest_sessionfinish(session):
+    data = api_metrics.to_dict()
+
+    # Nothing to report if no API calls were made
+    if not data['endpoints']:
+        return
+
+    # Log attribute will not exist if there is an error during collection
+    if hasattr(session, 'log'):
+        log = session.log
+        message = log.format.info_separator('API calls: timings per endpoint and status code')
+        message.add_line()
+        for line in api_metrics.summary_lines():
+            message.add_line(line)
+        log.info(message)
+
+    output = session.config.getoption('output', default=None)
+    if output:
+        # Same location as the other output artifacts (e.g. screenshots)
+        current_dir = os.path.dirname(__file__)
+        output_dir = os.path.join(current_dir, os.pardir, os.pardir, output)
+        if not os.path.exists(output_dir):
+            os.mkdir(output_dir)
+
+        api_metrics.write_json(os.path.join(output_dir, json_filename))
+        api_metrics.write_prometheus(os.path.join(output_dir, prometheus_filename))
@@ -1,16 +1,30 @@
+import functools
 import os
 import uuid
+from io import BytesIO
 
 import pytest
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None  # Screenshots are written as full-size PNGs
 
 
 """
 Plugin for taking a screenshot whenever a test that uses the browser fails or has an error.
+
+With --async-screenshots, only grabbing the screenshot (as PNG bytes, in memory) happens in the test's teardown: any
+downscaling (--screenshot-scale), re-encoding (--screenshot-format webp) and the write to disk happen on a background
+worker, which is drained at the end of the session. Downscaling and WebP need Pillow.
 """
 
 
 def pytest_sessionstart(session):
     session.screenshots = dict()
+    session.screenshot_writes = dict()  # Node ID -> (path, Future) of a screenshot being written in the background
+    session.screenshot_executor = None
 
 
 @pytest.fixture(scope='session', autouse=True)
@@ -39,10 +53,14 @@ def screenshot_on_failure(request, driver, output, log):
     """
     Adds a finalizer to each test that uses the driver to take a screenshot if the test fails.
     """
-    request.addfinalizer(screenshot(request, driver, output, log))
+    # Read from the config rather than parametrized (see pytest_generate_tests), so they don't appear in test IDs
+    config = request.config
+    request.addfinalizer(screenshot(request, driver, output, log, config.getoption('async_screenshots'),
+                                    config.getoption('screenshot_format'),
+                                    float(config.getoption('screenshot_scale'))))
 
 
-def screenshot(request, driver, output, log):
+def screenshot(request, driver, output, log, async_screenshots=False, image_format='png', scale=1.0):
     """
     Take a screenshot at the point of error/failure. It is Jenkins'/the build jobs' responsibility to clean up the
     output directory in its workspace.
@@ -53,9 +71,13 @@ def screenshot(request, driver, output, log):
 
         # Take a screenshot if the test failed (or had an error), but don't bother if it's of a blank page
         if take_screenshot and not is_page_blank(driver):
+            # Without Pillow, screenshots can only be written as they come from the driver
+            can_encode = Image is not None
+            encoded_format = image_format if can_encode else 'png'
+
             # File-safe name for the screenshot
             current_dir = os.path.dirname(__file__)
-            suffix = '_%s.png' % uuid.uuid4()
+            suffix = '_%s.%s' % (uuid.uuid4(), encoded_format)
             test_name = request.node.originalname[:255 - len(suffix)]
             filename = test_name + suffix
 
@@ -65,8 +87,25 @@ def screenshot(request, driver, output, log):
             if not os.path.exists(output_dir):
                 os.mkdir(output_dir)
 
-            # Save the screenshot, and delete the file if it failed
-            result = driver.save_screenshot(path)
+            if async_screenshots or (can_encode and (encoded_format != 'png' or scale != 1)):
+                # Only grab the PNG here (the browser may be gone by the time a background write happens)
+                write = functools.partial(write_screenshot, driver.get_screenshot_as_png(), path, encoded_format,
+                                          scale if can_encode else 1)
+                if async_screenshots:
+                    session = request.session
+                    if session.screenshot_executor is None:
+                        session.screenshot_executor = ThreadPoolExecutor(max_workers=2)
+                    session.screenshot_writes[request.node.nodeid] = (path, session.screenshot_executor.submit(write))
+                    result = True  # Failures are reported when the writes are drained (see pytest_sessionfinish)
+                else:
+                    try:
+                        result = write()
+                    except Exception:
+                        result = False
+            else:
+                result = driver.save_screenshot(path)
+
+            # Delete the file if saving the screenshot failed
             if not result:
                 if os.path.exists(path):
                     os.remove(path)
@@ -78,7 +117,70 @@ def screenshot(request, driver, output, log):
     return _screenshot
 
 
+def encode_screenshot(png, image_format='png', scale=1.0):
+    """
+    :param png: PNG bytes of a screenshot
+    :param image_format: Format to encode the screenshot in ('png' or 'webp')
+    :param scale: Factor to resize the screenshot by (e.g. 0.5 to halve its width and height)
+    :return: Encoded bytes (the PNG as it is, if there's nothing to do or Pillow isn't installed)
+    """
+    if Image is None or (image_format == 'png' and scale == 1):
+        return png
+
+    image = Image.open(BytesIO(png))
+    if scale != 1:
+        width, height = image.size
+        image = image.resize((max(1, int(width * scale)), max(1, int(height * scale))), Image.LANCZOS)
+
+    output = BytesIO()
+    if image_format == 'webp':
+        image.save(output, 'WEBP', quality=80, method=4)
+    else:
+        image.save(output, 'PNG', optimize=True)
+    return output.getvalue()
+
+
+def write_screenshot(png, path, image_format='png', scale=1.0):
+    """
+    Encodes a screenshot (see encode_screenshot) and writes it to a file.
+    :return: True (like WebDriver.save_screenshot)
+    """
+    data = encode_screenshot(png, image_format, scale)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return True
+
+
+def drain_screenshot_writes(session):
+    """
+    Waits for the screenshots being written in the background, dropping those that failed from session.screenshots
+    and deleting any partial files they left.
+    """
+    if session.screenshot_executor is not None:
+        session.screenshot_executor.shutdown(wait=True)
+        session.screenshot_executor = None
+
+    for node_id, (path, write) in session.screenshot_writes.items():
+        try:
+            write.result()
+        except Exception as e:
+            session.screenshots.pop(node_id, None)
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError:
+                pass
+            if hasattr(session, 'log'):
+                session.log.error('Failed to create screenshot %s for node %s: %s' % (
+                    os.path.basename(path), node_id, e
+                ))
+    session.screenshot_writes.clear()
+
+
 def pytest_sessionfinish(session):
+    if hasattr(session, 'screenshot_writes'):
+        drain_screenshot_writes(session)
+
     # Log attribute will not exist if there is an error during collection
     if hasattr(session, 'log'):
         log = session.log